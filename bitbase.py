@@ -0,0 +1,209 @@
+"""
+Win/draw bitbases for king and pawn, king and rook, and king and queen against a lone king. The lone king can never
+win these endings, so one bit per position says everything: set if the side with the extra piece wins, whoever is to
+move, clear if it is a draw.
+Positions are indexed with the extra piece white (a black one is mirrored onto the other side of the board):
+    index = ((side to move * 64 + white king square) * 64 + black king square) * 64 + piece square
+with side to move 0 for white, 1 for black and squares numbered row * 8 + col like the rest of the engine.
+Each table is 2 * 64 * 64 * 64 bits (64KB) on disk.
+
+usage: python bitbase.py    generates all of them into the bitbases folder (takes a few minutes)
+"""
+
+from array import array
+import os
+import time
+import engine
+from bitboard import lsb, pop_count
+from evaluation import PIECE_VALUES
+
+ENDGAMES = ("KQK", "KRK", "KPK")  # in the order they have to be generated, KPK looks up KQK after a promotion
+BITBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bitbases")
+POSITIONS = 2 * 64 * 64 * 64
+KNOWN_WIN = 100  # score of a won position, above any material count and below smart_move_finder.CHECKMATE
+
+tables = {}  # endgame name -> bytes, None once a missing file has been looked for
+
+
+def index(white_to_move, white_king, black_king, piece_square):
+    return (((0 if white_to_move else 64) + white_king) * 64 + black_king) * 64 + piece_square
+
+
+def get_bit(table, i):
+    return table[i >> 3] >> (i & 7) & 1
+
+
+"""
+Builds the bitbase for one endgame with retrograde analysis. Every legal position is set up on a GameState and its
+moves generated by the engine's own rules, which gives the moves between positions. Then, starting from the
+positions where the lone king is mated, wins are propagated backwards: a position with white to move is won if one
+of its moves reaches a won position, one with black to move once all of its moves do
+"""
+
+
+def generate(endgame, queen_table=None):
+    piece = "w" + endgame[1]
+    gs = engine.GameState()
+    gs.load_fen("8/8/8/8/8/8/8/8 w - - 0 1")
+    won = bytearray(POSITIONS)
+    remaining = array("i", bytes(4 * POSITIONS))  # black to move: moves not yet known to lose
+    edge_from = array("i")
+    edge_to = array("i")
+    queue = []
+    for white_to_move in (True, False):
+        for white_king in range(64):
+            for black_king in range(64):
+                for piece_square in range(64):
+                    if len({white_king, black_king, piece_square}) < 3:
+                        continue
+                    if piece == "wP" and not 8 <= piece_square < 56:
+                        continue
+                    set_up(gs, white_to_move, white_king, black_king, piece, piece_square)
+                    # the side that just moved can't be in check
+                    if white_to_move and gs.is_attacked(black_king, "w", gs.occupied):
+                        continue
+                    if not white_to_move and gs.is_attacked(white_king, "b", gs.occupied):
+                        continue
+                    i = index(white_to_move, white_king, black_king, piece_square)
+                    moves = gs.get_valid_moves()
+                    if len(moves) == 0:
+                        if gs.in_check and not white_to_move:  # checkmate
+                            won[i] = 1
+                            queue.append(i)
+                        continue
+                    if not white_to_move:
+                        remaining[i] = len(moves)
+                    for move in moves:
+                        start = move.start_row * 8 + move.start_col
+                        end = move.end_row * 8 + move.end_col
+                        if move.is_capture:  # only the lone king captures, and that leaves a draw
+                            continue
+                        if move.is_pawn_promotion:  # auto-queen, the KQK table knows the rest
+                            if not won[i] and get_bit(queen_table, index(False, white_king, black_king, end)):
+                                won[i] = 1
+                                queue.append(i)
+                            continue
+                        if start == white_king:
+                            j = index(not white_to_move, end, black_king, piece_square)
+                        elif start == black_king:
+                            j = index(not white_to_move, white_king, end, piece_square)
+                        else:
+                            j = index(not white_to_move, white_king, black_king, end)
+                        edge_from.append(i)
+                        edge_to.append(j)
+
+    # group the moves by the position they lead to, so the positions leading to a position can be looked up
+    first_edge = array("i", bytes(4 * (POSITIONS + 1)))
+    for j in edge_to:
+        first_edge[j + 1] += 1
+    for j in range(POSITIONS):
+        first_edge[j + 1] += first_edge[j]
+    fill = array("i", first_edge)
+    previous = array("i", bytes(4 * len(edge_to)))
+    for i, j in zip(edge_from, edge_to):
+        previous[fill[j]] = i
+        fill[j] += 1
+
+    black_to_move = 64 * 64 * 64
+    while queue:
+        j = queue.pop()
+        for k in range(first_edge[j], first_edge[j + 1]):
+            i = previous[k]
+            if won[i]:
+                continue
+            if i >= black_to_move:
+                remaining[i] -= 1
+                if remaining[i] > 0:
+                    continue
+            won[i] = 1
+            queue.append(i)
+    return pack(won)
+
+
+def set_up(gs, white_to_move, white_king, black_king, piece, piece_square):
+    gs.board = [["--"] * 8 for _ in range(8)]
+    gs.board[white_king // 8][white_king % 8] = "wK"
+    gs.board[black_king // 8][black_king % 8] = "bK"
+    gs.board[piece_square // 8][piece_square % 8] = piece
+    gs.white_king_location = (white_king // 8, white_king % 8)
+    gs.black_king_location = (black_king // 8, black_king % 8)
+    gs.white_to_move = white_to_move
+    gs.init_bitboards()
+
+
+def pack(flags):
+    table = bytearray(len(flags) // 8)
+    for i in range(len(flags)):
+        if flags[i]:
+            table[i >> 3] |= 1 << (i & 7)
+    return bytes(table)
+
+
+def load(endgame):
+    if endgame not in tables:
+        path = os.path.join(BITBASE_DIR, endgame + ".bin")
+        tables[endgame] = None
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                tables[endgame] = file.read()
+    return tables[endgame]
+
+
+"""
+Score of a position with two kings and one pawn, rook or queen from white's point of view, or None if the position
+isn't one of these endings or its bitbase hasn't been generated.
+A win scores KNOWN_WIN plus a little for progress, so the search still heads for the mate (or the promotion):
+the lone king pushed to the edge and the kings close together, or the pawn further up the board with its king
+"""
+
+
+def probe(gs):
+    others = gs.occupied & ~(gs.bitboards["wK"] | gs.bitboards["bK"])
+    if pop_count(others) != 1:
+        return None
+    for piece in ("wQ", "bQ", "wR", "bR", "wP", "bP"):
+        if gs.bitboards[piece] & others:
+            break
+    else:
+        return None  # a minor piece
+    table = load("K" + piece[1] + "K")
+    if table is None:
+        return None
+    white_king = lsb(gs.bitboards["wK"])
+    black_king = lsb(gs.bitboards["bK"])
+    piece_square = lsb(others)
+    white_to_move = gs.white_to_move
+    sign = 1
+    if piece[0] == "b":  # mirror the board so the extra piece is white
+        white_king, black_king = black_king ^ 56, white_king ^ 56
+        piece_square ^= 56
+        white_to_move = not white_to_move
+        sign = -1
+    if not get_bit(table, index(white_to_move, white_king, black_king, piece_square)):
+        return 0
+    if piece[1] == "P":
+        # the pawn up the board with the king next to it
+        progress = 2 * (6 - piece_square // 8) + 7 - max(abs(piece_square // 8 - white_king // 8),
+                                                          abs(piece_square % 8 - white_king % 8))
+    else:
+        row, col = black_king // 8, black_king % 8
+        edge = max(3 - row, row - 4) + max(3 - col, col - 4)  # 0 in the centre, 6 in a corner
+        kings = abs(row - white_king // 8) + abs(col - white_king % 8)
+        # the rows and columns the piece's rank and file shut the lone king into
+        piece_row, piece_col = piece_square // 8, piece_square % 8
+        rows = piece_row if row < piece_row else 7 - piece_row if row > piece_row else 8
+        cols = piece_col if col < piece_col else 7 - piece_col if col > piece_col else 8
+        progress = 2 * edge + 14 - kings + (64 - rows * cols) // 4
+    return sign * (KNOWN_WIN + PIECE_VALUES[piece[1]] + 0.1 * progress)
+
+
+if __name__ == "__main__":
+    os.makedirs(BITBASE_DIR, exist_ok=True)
+    for name in ENDGAMES:
+        begin_time = time.perf_counter()
+        table = generate(name, load("KQK"))
+        with open(os.path.join(BITBASE_DIR, name + ".bin"), "wb") as file:
+            file.write(table)
+        tables[name] = table
+        wins = sum(bin(byte).count("1") for byte in table)
+        print(name, wins, "won positions,", round(time.perf_counter() - begin_time, 1), "s")
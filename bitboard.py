@@ -0,0 +1,103 @@
+"""
+Precomputed bitboard masks and attack tables used by the move generator.
+A bitboard is a 64 bit integer with one bit per square. Square 0 is a8 (row 0, col 0) and square 63 is h1 (row 7, col 7),
+so square = row * 8 + col lines up with the indexing of GameState.board
+"""
+
+FULL = (1 << 64) - 1
+SQUARE_BB = [1 << square for square in range(64)]
+ROW_COL = [(square // 8, square % 8) for square in range(64)]  # square index -> (row, col) tuple
+FILE_A = sum(SQUARE_BB[row * 8] for row in range(8))
+FILE_H = FILE_A << 7
+
+# (row, col) steps. Positive directions increase the square index, so the nearest blocker is the lowest set bit
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_STEPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_STEPS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def square_index(row, col):
+    return row * 8 + col
+
+
+def lsb(bb):
+    return (bb & -bb).bit_length() - 1
+
+
+def pop_count(bb):
+    return bin(bb).count("1")
+
+
+def _step_table(steps):
+    table = []
+    for row in range(8):
+        for col in range(8):
+            mask = 0
+            for dr, dc in steps:
+                if 0 <= row + dr <= 7 and 0 <= col + dc <= 7:
+                    mask |= SQUARE_BB[square_index(row + dr, col + dc)]
+            table.append(mask)
+    return table
+
+
+def _ray_table(direction):
+    table = []
+    for row in range(8):
+        for col in range(8):
+            mask = 0
+            r, c = row + direction[0], col + direction[1]
+            while 0 <= r <= 7 and 0 <= c <= 7:
+                mask |= SQUARE_BB[square_index(r, c)]
+                r, c = r + direction[0], c + direction[1]
+            table.append(mask)
+    return table
+
+
+KNIGHT_ATTACKS = _step_table(KNIGHT_STEPS)
+KING_ATTACKS = _step_table(KING_STEPS)
+# squares attacked by a pawn of the given color standing on a square
+PAWN_ATTACKS = {"w": _step_table(((-1, -1), (-1, 1))), "b": _step_table(((1, -1), (1, 1)))}
+
+RAYS = {direction: _ray_table(direction) for direction in ROOK_DIRECTIONS + BISHOP_DIRECTIONS}
+# (ray table, nearest blocker is the lowest bit) pairs so the hot loops don't have to work out the direction sign
+ROOK_RAYS = tuple((RAYS[d], d[0] > 0 or (d[0] == 0 and d[1] > 0)) for d in ROOK_DIRECTIONS)
+BISHOP_RAYS = tuple((RAYS[d], d[0] > 0) for d in BISHOP_DIRECTIONS)
+
+
+def _between_table():
+    # BETWEEN[a][b] holds the squares strictly between a and b when they share a line, otherwise 0
+    table = [[0] * 64 for _ in range(64)]
+    for direction, rays in RAYS.items():
+        for start in range(64):
+            row, col = ROW_COL[start]
+            between = 0
+            r, c = row + direction[0], col + direction[1]
+            while 0 <= r <= 7 and 0 <= c <= 7:
+                end = square_index(r, c)
+                table[start][end] = between
+                between |= SQUARE_BB[end]
+                r, c = r + direction[0], c + direction[1]
+    return table
+
+
+BETWEEN = _between_table()
+
+
+def slider_attacks(square, occupied, rays):
+    """
+    Squares attacked by a sliding piece along the given rays, stopping at (and including) the first blocker
+    """
+    attacks = 0
+    for table, positive in rays:
+        ray = table[square]
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= table[blocker]
+        attacks |= ray
+    return attacks
+
@@ -1,5 +1,37 @@
-import copy
-import main
+from array import array
+import zobrist
+from evaluation import MATERIAL, POSITIONAL
+from bitboard import FULL, FILE_A, FILE_H, SQUARE_BB, ROW_COL, KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, ROOK_RAYS, BISHOP_RAYS, \
+    BETWEEN, slider_attacks
+
+# castling rights bits, in the order zobrist.CASTLING_KEYS is indexed by
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+ALL_CASTLING = 15
+CASTLING_FLAGS = {"wK": WHITE_KINGSIDE, "wQ": WHITE_QUEENSIDE, "bK": BLACK_KINGSIDE, "bQ": BLACK_QUEENSIDE}
+# castling rights left after a move touches a square: moving the king or a rook, or capturing a rook, loses them
+CASTLING_MASK = [ALL_CASTLING] * 64
+CASTLING_MASK[0] = ALL_CASTLING & ~BLACK_QUEENSIDE
+CASTLING_MASK[4] = ALL_CASTLING & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASK[7] = ALL_CASTLING & ~BLACK_KINGSIDE
+CASTLING_MASK[56] = ALL_CASTLING & ~WHITE_QUEENSIDE
+CASTLING_MASK[60] = ALL_CASTLING & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASK[63] = ALL_CASTLING & ~WHITE_KINGSIDE
+
+# undo stack record: two words per move, the state the move can't be undone from plus the hash before it
+NO_SQUARE = 64  # en passant square when there is none
+EN_PASSANT_SHIFT = 4
+HALFMOVE_SHIFT = 11
+UNDO_STACK_SIZE = 256  # moves, doubled whenever a game gets longer
+
+# for each castle: the squares between king and rook that have to be empty, and the squares the king passes through
+# and lands on, which can't be attacked (the square it starts on is covered by the in check test)
+CASTLE_EMPTY = {"wK": SQUARE_BB[61] | SQUARE_BB[62], "wQ": SQUARE_BB[57] | SQUARE_BB[58] | SQUARE_BB[59],
+                "bK": SQUARE_BB[5] | SQUARE_BB[6], "bQ": SQUARE_BB[1] | SQUARE_BB[2] | SQUARE_BB[3]}
+CASTLE_SAFE = {"wK": SQUARE_BB[61] | SQUARE_BB[62], "wQ": SQUARE_BB[58] | SQUARE_BB[59],
+               "bK": SQUARE_BB[5] | SQUARE_BB[6], "bQ": SQUARE_BB[2] | SQUARE_BB[3]}
 
 """
 Responsible for storing all the information about the current state of the chess game.
@@ -31,20 +63,95 @@ class GameState:
         self.white_king_location = (7, 4)
         self.black_king_location = (0, 4)
         self.in_check = False
-        self.pins = []
-        self.checks = []
+        self.pins = {}  # square of a pinned piece -> squares it can still move to
+        self.checks = 0  # bitboard of the pieces giving check
         self.checkmate = False
         self.stalemate = False
         self.en_passant_possible = ()  # coordinates of end square where en passant capture is possible
-        self.en_passant_possible_log = [self.en_passant_possible]
-        self.current_castling_rights = CastleRights(True, True, True, True)
-        self.castle_rights_log = [CastleRights(self.current_castling_rights.wks, self.current_castling_rights.bks,
-                                               self.current_castling_rights.wqs, self.current_castling_rights.bqs)]
+        self.castling_rights = ALL_CASTLING  # bitmask of WHITE_KINGSIDE etc.
+        self.halfmove_clock = 0  # moves since the last capture or pawn move
+        # what make_move can't work out backwards, saved before every move so undo_move just reads it back:
+        # word 2 * ply is castling rights | en passant square << EN_PASSANT_SHIFT | halfmove clock << HALFMOVE_SHIFT,
+        # word 2 * ply + 1 the hash. Preallocated, so making and undoing moves doesn't create any objects
+        self.undo_stack = array("Q", bytes(16 * UNDO_STACK_SIZE))
+        self.bitboards = {}  # one bitboard per piece e.g. self.bitboards["wN"]
+        self.color_bitboards = {}  # every square occupied by a color
+        self.occupied = 0
+        self.check_mask = FULL  # squares a non-king piece may move to, narrowed to block/capture squares when in check
+        self.target_mask = FULL  # squares any piece may move to, only enemy pieces when generating captures
+        self.captures_only = False  # generating only captures, pawns that can't take anything are skipped
+        self.quiets_only = False  # generating only non-captures, which leaves out en passant
+        self.zobrist_key = 0  # hash of the position, updated incrementally by make_move and undo_move
+        self.material = 0  # material balance, positive is good for white
+        self.positional = 0  # piece-square table balance in hundredths of a pawn
+        self.init_bitboards()
+
+    """
+    Builds the bitboards from the board. Only needs to be called when the board is set up from scratch,
+    make_move and undo_move keep them in sync afterwards
+    """
+    def init_bitboards(self):
+        self.bitboards = {color + piece: 0 for color in "wb" for piece in "PNBRQK"}
+        self.color_bitboards = {"w": 0, "b": 0}
+        self.material = 0
+        self.positional = 0
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != "--":
+                    self.bitboards[piece] |= SQUARE_BB[row * 8 + col]
+                    self.color_bitboards[piece[0]] |= SQUARE_BB[row * 8 + col]
+                    self.material += MATERIAL[piece]
+                    self.positional += POSITIONAL[piece][row * 8 + col]
+        self.occupied = self.color_bitboards["w"] | self.color_bitboards["b"]
+        self.zobrist_key = zobrist.compute_key(self)
+
+    """
+    Sets up the position from a FEN string e.g. "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+    The move counters at the end are optional, only the halfmove clock is kept. Clears the move log so the position can't be undone past
+    """
+    def load_fen(self, fen):
+        fields = fen.split()
+        self.board = []
+        for rank in fields[0].split("/"):
+            row = []
+            for char in rank:
+                if char.isdigit():
+                    row += ["--"] * int(char)
+                else:
+                    row.append(("w" if char.isupper() else "b") + char.upper())
+            self.board.append(row)
+        for row in range(8):
+            for col in range(8):
+                if self.board[row][col] == "wK":
+                    self.white_king_location = (row, col)
+                elif self.board[row][col] == "bK":
+                    self.black_king_location = (row, col)
+        self.white_to_move = fields[1] == "w"
+        castling = fields[2] if len(fields) > 2 else "-"
+        self.castling_rights = 0
+        for char, flag in (("K", WHITE_KINGSIDE), ("Q", WHITE_QUEENSIDE), ("k", BLACK_KINGSIDE), ("q", BLACK_QUEENSIDE)):
+            if char in castling:
+                self.castling_rights |= flag
+        en_passant = fields[3] if len(fields) > 3 else "-"
+        if en_passant == "-":
+            self.en_passant_possible = ()
+        else:
+            self.en_passant_possible = (Move.ranks_to_rows[en_passant[1]], Move.files_to_cols[en_passant[0]])
+        self.halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+        self.move_log = []
+        self.checkmate = False
+        self.stalemate = False
+        self.init_bitboards()
 
     """
     Accepts a Move as a parameter and executes it
     """
     def make_move(self, move):
+        self.push_state()
+        # take the castling rights and en passant square out of the hash, the new ones are added back in at the end
+        self.zobrist_key ^= zobrist.castling_key(self.castling_rights) ^ \
+            zobrist.en_passant_key(self.en_passant_possible) ^ zobrist.SIDE_KEY
         self.board[move.start_row][move.start_col] = "--"
         self.board[move.end_row][move.end_col] = move.piece_moved
         self.move_log.append(move)
@@ -69,8 +176,10 @@ class GameState:
         else:
             self.en_passant_possible = ()
 
-        # update en passant log
-        self.en_passant_possible_log.append(self.en_passant_possible)
+        if move.piece_moved[1] == "P" or move.is_capture:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
 
         # castle move
         if move.is_castle_move:
@@ -81,10 +190,25 @@ class GameState:
                 self.board[move.end_row][move.end_col + 1] = self.board[move.end_row][move.end_col - 2]  # move the rook
                 self.board[move.end_row][move.end_col - 2] = "--"  # erase the old rook
 
-        # update castling rights whenever a rook or a king moves
-        self.update_castle_rights(move)
-        self.castle_rights_log.append(CastleRights(self.current_castling_rights.wks, self.current_castling_rights.bks,
-                                                   self.current_castling_rights.wqs, self.current_castling_rights.bqs))
+        self.update_bitboards(move, 1)
+
+        # update castling rights whenever a king or rook moves or a rook is captured
+        self.castling_rights &= CASTLING_MASK[move.start_row * 8 + move.start_col] & \
+            CASTLING_MASK[move.end_row * 8 + move.end_col]
+        self.zobrist_key ^= zobrist.castling_key(self.castling_rights) ^ \
+            zobrist.en_passant_key(self.en_passant_possible)
+
+    """
+    Passes the turn without moving, for null move pruning in the search. None goes on the move log in place of a move,
+    so undo_move takes it back like any other
+    """
+    def make_null_move(self):
+        self.push_state()
+        self.zobrist_key ^= zobrist.en_passant_key(self.en_passant_possible) ^ zobrist.SIDE_KEY
+        self.en_passant_possible = ()
+        self.halfmove_clock += 1
+        self.white_to_move = not self.white_to_move
+        self.move_log.append(None)
 
     """
     Undoes the last move made
@@ -92,6 +216,12 @@ class GameState:
     def undo_move(self):
         if len(self.move_log) != 0:  # make sure there is a move to undo
             move = self.move_log.pop()  # delete the move with reference
+            if move is None:  # a null move, nothing on the board changed
+                self.white_to_move = not self.white_to_move
+                self.pop_state()
+                self.checkmate = False  # set by a get_valid_moves after the null move, no longer true
+                self.stalemate = False
+                return
             self.board[move.start_row][move.start_col] = move.piece_moved  # put the piece back where it was
             self.board[move.end_row][move.end_col] = move.piece_captured  # return the attacked square to original state
             if move.piece_moved == "wK":  # update the king position tuple if needed
@@ -105,14 +235,6 @@ class GameState:
                 self.board[move.end_row][move.end_col] = "--"  # leave landing space blank
                 self.board[move.start_row][move.end_col] = move.piece_captured
 
-            # update en passant
-            self.en_passant_possible_log.pop()
-            self.en_passant_possible = self.en_passant_possible_log[-1]
-
-            # undo castling rights
-            self.castle_rights_log.pop()  # delete the updated castle rights since we are undoing that move
-            self.current_castling_rights = copy.deepcopy(self.castle_rights_log[-1])  # set the castle rights to the previous state
-
             # undo castling
             if move.is_castle_move:
                 if move.end_col - move.start_col == 2:  # kingside castle
@@ -122,97 +244,127 @@ class GameState:
                     self.board[move.end_row][move.end_col - 2] = self.board[move.end_row][move.end_col + 1]
                     self.board[move.end_row][move.end_col + 1] = "--"
 
+            # every bitboard update is an xor, so applying the move again takes it back
+            self.update_bitboards(move, -1)
+
+            # castling rights, en passant square, halfmove clock and hash from before the move
+            self.pop_state()
+
             # undo checkmate, stalemate since undoing a move reverses any of these
             self.checkmate = False
             self.stalemate = False
 
+    """
+    Toggles the squares a move touches on the bitboards and the piece keys in the hash, and adds the change in
+    material and piece-square score to the running totals. Used by both make_move (sign 1) and undo_move (sign -1)
+    """
+    def update_bitboards(self, move, sign):
+        bitboards = self.bitboards
+        piece_keys = zobrist.PIECE_KEYS
+        color = move.piece_moved[0]
+        start_square = move.start_row * 8 + move.start_col
+        end_square = move.end_row * 8 + move.end_col
+        start = SQUARE_BB[start_square]
+        end = SQUARE_BB[end_square]
+        if move.is_pawn_promotion:
+            bitboards[move.piece_moved] ^= start
+            bitboards[color + "Q"] ^= end
+            self.zobrist_key ^= piece_keys[move.piece_moved][start_square] ^ piece_keys[color + "Q"][end_square]
+            material = MATERIAL[color + "Q"] - MATERIAL[move.piece_moved]
+            positional = POSITIONAL[color + "Q"][end_square] - POSITIONAL[move.piece_moved][start_square]
+        else:
+            bitboards[move.piece_moved] ^= start | end
+            self.zobrist_key ^= piece_keys[move.piece_moved][start_square] ^ piece_keys[move.piece_moved][end_square]
+            material = 0
+            positional = POSITIONAL[move.piece_moved][end_square] - POSITIONAL[move.piece_moved][start_square]
+        self.color_bitboards[color] ^= start | end
+        if move.piece_captured != "--":
+            captured_square = move.start_row * 8 + move.end_col if move.en_passant_move else end_square
+            bitboards[move.piece_captured] ^= SQUARE_BB[captured_square]
+            self.color_bitboards[move.piece_captured[0]] ^= SQUARE_BB[captured_square]
+            self.zobrist_key ^= piece_keys[move.piece_captured][captured_square]
+            material -= MATERIAL[move.piece_captured]
+            positional -= POSITIONAL[move.piece_captured][captured_square]
+        if move.is_castle_move:
+            if move.end_col - move.start_col == 2:  # kingside castle
+                rook_start, rook_end = move.end_row * 8 + 7, move.end_row * 8 + 5
+            else:  # queenside castle
+                rook_start, rook_end = move.end_row * 8, move.end_row * 8 + 3
+            bitboards[color + "R"] ^= SQUARE_BB[rook_start] | SQUARE_BB[rook_end]
+            self.color_bitboards[color] ^= SQUARE_BB[rook_start] | SQUARE_BB[rook_end]
+            self.zobrist_key ^= piece_keys[color + "R"][rook_start] ^ piece_keys[color + "R"][rook_end]
+            positional += POSITIONAL[color + "R"][rook_end] - POSITIONAL[color + "R"][rook_start]
+        self.material += sign * material
+        self.positional += sign * positional
+        self.occupied = self.color_bitboards["w"] | self.color_bitboards["b"]
 
     """
-    Update the castling rights given the move
+    Saves the state for the move about to be made at the top of the undo stack, which is as deep as the move log
     """
-    def update_castle_rights(self, move):
-        # if the king moves, castling is no longer possible
-        if move.piece_moved == "wK":
-            self.current_castling_rights.wks = False
-            self.current_castling_rights.wqs = False
-        elif move.piece_moved == "bK":
-            self.current_castling_rights.bks = False
-            self.current_castling_rights.bqs = False
-        # if the rook moves, castling is not possible on that side anymore
-        elif move.piece_moved == "wR":  # white rook
-            if move.start_col == 0:  # queen side rook
-                self.current_castling_rights.wqs = False
-            elif move.start_col == 7:  # king size rook
-                self.current_castling_rights.wks = False
-        elif move.piece_moved == "bR":  # black rook
-            if move.start_col == 0:  # queen side rook
-                self.current_castling_rights.bqs = False
-            elif move.start_col == 7:  # king side rook
-                self.current_castling_rights.bks = False
-        # if a rook is captured
-        if move.piece_captured == "wR":
-            if move.end_row == 7:
-                if move.end_col == 0:
-                    self.current_castling_rights.wqs = False
-                elif move.end_col == 7:
-                    self.current_castling_rights.wks = False
-        elif move.piece_captured == "bR":
-            if move.end_row == 0:
-                if move.end_col == 0:
-                    self.current_castling_rights.bqs = False
-                elif move.end_col == 7:
-                    self.current_castling_rights.bks = False
+    def push_state(self):
+        i = 2 * len(self.move_log)
+        if i == len(self.undo_stack):
+            self.undo_stack.extend(self.undo_stack)  # only the entries below i are ever read
+        en_passant = self.en_passant_possible
+        square = en_passant[0] * 8 + en_passant[1] if en_passant != () else NO_SQUARE
+        self.undo_stack[i] = self.castling_rights | square << EN_PASSANT_SHIFT | self.halfmove_clock << HALFMOVE_SHIFT
+        self.undo_stack[i + 1] = self.zobrist_key
 
     """
-    All moves considering checks
+    Restores the state saved by push_state, called by undo_move once the move is off the move log
     """
-    def get_valid_moves(self):
-        moves = []
-        self.in_check, self. pins, self.checks = self.get_pins_and_checks()
-        temp_castle_rights = CastleRights(self.current_castling_rights.wks, self.current_castling_rights.bks,
-                                          self.current_castling_rights.wqs, self.current_castling_rights.bqs)
+    def pop_state(self):
+        i = 2 * len(self.move_log)
+        state = self.undo_stack[i]
+        self.castling_rights = state & ALL_CASTLING
+        square = state >> EN_PASSANT_SHIFT & 127
+        self.en_passant_possible = ROW_COL[square] if square != NO_SQUARE else ()
+        self.halfmove_clock = state >> HALFMOVE_SHIFT
+        self.zobrist_key = self.undo_stack[i + 1]
 
+    """
+    All moves considering checks
+    With captures_only only legal captures (including en passant) are generated, with quiets_only only the rest
+    (including castling and promotions that don't capture), so the search can generate one part at a time.
+    An empty list then doesn't mean checkmate or stalemate, so those flags are left alone
+    """
+    def get_valid_moves(self, captures_only=False, quiets_only=False):
+        self.in_check, self.pins, self.checks = self.get_pins_and_checks()
+        self.captures_only = captures_only
+        self.quiets_only = quiets_only
         if self.white_to_move:
-            king_row = self.white_king_location[0]
-            king_col = self.white_king_location[1]
-            self.get_castle_moves(self.white_king_location[0], self.white_king_location[1], moves, "w")
+            king_square = self.white_king_location[0] * 8 + self.white_king_location[1]
+            enemies = self.color_bitboards["b"]
         else:
-            king_row = self.black_king_location[0]
-            king_col = self.black_king_location[1]
-            self.get_castle_moves(self.black_king_location[0], self.black_king_location[1], moves, "b")
-        if self.in_check:  # if in check
-            if len(self.checks) == 1:  # if there's only one piece checking, you can block or capture
+            king_square = self.black_king_location[0] * 8 + self.black_king_location[1]
+            enemies = self.color_bitboards["w"]
+        if captures_only:
+            self.target_mask = enemies
+        elif quiets_only:
+            self.target_mask = FULL & ~self.occupied
+        else:
+            self.target_mask = FULL
+
+        if self.in_check:
+            checks = self.checks
+            if checks & (checks - 1) == 0:  # only one piece checking, so you can block or capture
+                checker = checks.bit_length() - 1
+                self.check_mask = (BETWEEN[king_square][checker] | checks) & self.target_mask
                 moves = self.get_all_possible_moves()
-                check = self.checks[0]  # get check info
-                check_row = check[0]
-                check_col = check[1]
-                piece_checking = self.board[check_row][check_col]
-                valid_squares = []  # list of valid squares pieces can move to
-                # if the piece is a knight, you must capture the knight or move king
-                if piece_checking[1] == "N":
-                    valid_squares = [(check_row, check_col)]
-                else:
-                    for i in range(1, 8):
-                        valid_square = (king_row + check[2] * i, king_col + check[3] * i)
-                        valid_squares.append(valid_square)
-                        if valid_square[0] == check_row and valid_square[1] == check_col:  # you have reached the piece
-                            break
-                for i in range(len(moves) - 1, -1, -1):  # iterate backwards so we can delete without skipping
-                    if moves[i].piece_moved[1] != "K":  # king doesn't move so it must be a block or capture
-                        if not (moves[i].end_row, moves[i].end_col) in valid_squares:  # move doesn't block or capture
-                            moves.remove(moves[i])
             else:  # double check => king must move
-                self.get_king_moves(king_row, king_col, moves)
+                moves = []
+                self.get_king_moves(king_square, moves)
         else:  # not in check
+            self.check_mask = self.target_mask
             moves = self.get_all_possible_moves()
+            if not captures_only:
+                if self.white_to_move:
+                    self.get_castle_moves(self.white_king_location[0], self.white_king_location[1], moves, "w")
+                else:
+                    self.get_castle_moves(self.black_king_location[0], self.black_king_location[1], moves, "b")
 
-        if self.white_to_move:
-            self.get_castle_moves(self.white_king_location[0], self.white_king_location[1], moves, "w")
-        else:
-            self.get_castle_moves(self.black_king_location[0], self.black_king_location[1], moves, "b")
-
-        self.current_castling_rights = temp_castle_rights
-
+        if captures_only or quiets_only:
+            return moves
         if len(moves) == 0:
             if self.in_check:
                 self.checkmate = True
@@ -220,6 +372,38 @@ class GameState:
                 self.stalemate = True
         return moves
 
+    """
+    The legal Move with this move_ID, or None if there isn't one. Only the moves of the piece on the start square to
+    the end square are generated, so the search can check a move from the transposition table before trying it
+    without generating everything else
+    """
+    def legal_move(self, move_id):
+        start, end = move_id & 63, move_id >> 6
+        piece = self.board[start // 8][start % 8]
+        if piece == "--" or (piece[0] == "w") != self.white_to_move:
+            return None
+        self.in_check, self.pins, self.checks = self.get_pins_and_checks()
+        self.captures_only = self.quiets_only = False
+        self.target_mask = SQUARE_BB[end]
+        if self.in_check:
+            checks = self.checks
+            if checks & (checks - 1) and piece[1] != "K":  # double check, only the king can move
+                return None
+            king_location = self.white_king_location if self.white_to_move else self.black_king_location
+            king_square = king_location[0] * 8 + king_location[1]
+            # not narrowed to the end square, en passant can take a checking pawn that isn't on it
+            self.check_mask = BETWEEN[king_square][checks.bit_length() - 1] | checks
+        else:
+            self.check_mask = self.target_mask
+        moves = []
+        self.move_functions[piece[1]](start, moves)
+        if piece[1] == "K" and abs(end - start) == 2:
+            self.get_castle_moves(start // 8, start % 8, moves, piece[0])
+        for move in moves:
+            if move.move_ID == move_id:
+                return move
+        return None
+
     """
     Determines if the current player is in check
     """
@@ -233,387 +417,258 @@ class GameState:
     Determines if a square is attacked by an enemy piece
     """
     def square_under_attack(self, row, col):
-        self.white_to_move = not self.white_to_move  # pretend it's the opponent's turn
-        opponent_moves = self.get_all_possible_moves()  # generate all their moves
-        self.white_to_move = not self.white_to_move  # set the move back to our turn
-        for move in opponent_moves:  # iterate through our list of opponent moves
-            if move.end_row == row and move.end_col == col:  # check if the move attacks our square
-                return True
+        enemy_color = "b" if self.white_to_move else "w"
+        return self.is_attacked(row * 8 + col, enemy_color, self.occupied)
+
+    """
+    Looks outwards from the square with every piece pattern and checks whether an enemy piece sits on the other end.
+    Occupied is passed in so the king can be taken off the board when checking the squares it moves to
+    """
+    def is_attacked(self, square, enemy_color, occupied):
+        bitboards = self.bitboards
+        if KNIGHT_ATTACKS[square] & bitboards[enemy_color + "N"]:
+            return True
+        if KING_ATTACKS[square] & bitboards[enemy_color + "K"]:
+            return True
+        # an enemy pawn attacks this square if a pawn of our color standing here would attack the enemy pawn
+        if PAWN_ATTACKS["w" if enemy_color == "b" else "b"][square] & bitboards[enemy_color + "P"]:
+            return True
+        queens = bitboards[enemy_color + "Q"]
+        if slider_attacks(square, occupied, ROOK_RAYS) & (bitboards[enemy_color + "R"] | queens):
+            return True
+        if slider_attacks(square, occupied, BISHOP_RAYS) & (bitboards[enemy_color + "B"] | queens):
+            return True
         return False
 
     """
-    All moves not considering checks
+    Bitboard of every square a side attacks, for questions about several squares at once.
+    Occupied defaults to the current board
+    """
+    def attack_map(self, color, occupied=None):
+        if occupied is None:
+            occupied = self.occupied
+        bitboards = self.bitboards
+        attacks = 0
+        for piece, table in (("P", PAWN_ATTACKS[color]), ("N", KNIGHT_ATTACKS), ("K", KING_ATTACKS)):
+            pieces = bitboards[color + piece]
+            while pieces:
+                square_bb = pieces & -pieces
+                pieces ^= square_bb
+                attacks |= table[square_bb.bit_length() - 1]
+        queens = bitboards[color + "Q"]
+        sliders = ((bitboards[color + "R"] | queens, ROOK_RAYS), (bitboards[color + "B"] | queens, BISHOP_RAYS))
+        for pieces, rays in sliders:
+            while pieces:
+                square_bb = pieces & -pieces
+                pieces ^= square_bb
+                attacks |= slider_attacks(square_bb.bit_length() - 1, occupied, rays)
+        return attacks
+
+    """
+    All moves not considering checks, other than the pins and check mask set up by get_valid_moves
     """
     def get_all_possible_moves(self):
         moves = []
-        #  traverse the board looking for pieces
-        for row in range(len(self.board)):
-            for col in range(len(self.board)):
-                turn = self.board[row][col][0]
-                # if you find a piece and it's their turn
-                if (turn == 'w' and self.white_to_move) or (turn == 'b' and not self.white_to_move):
-                    piece = self.board[row][col][1]  # get the piece type
-                    self.move_functions[piece](row, col, moves)  # find all the possible moves for that piece
+        ally_color = "w" if self.white_to_move else "b"
+        for piece in "PNBRQK":
+            pieces = self.bitboards[ally_color + piece]
+            if piece == "P" and self.captures_only:
+                pieces &= self.pawn_capturers()
+            while pieces:
+                square_bb = pieces & -pieces
+                pieces ^= square_bb
+                self.move_functions[piece](square_bb.bit_length() - 1, moves)  # find all the moves for that piece
         return moves
 
     """
-    Checks for pins and checks
+    Squares a pawn of the side to move would have to stand on to capture an enemy piece or en passant, worked out for
+    all pawns at once so capture generation doesn't visit the pawns with nothing to take
+    """
+    def pawn_capturers(self):
+        if self.white_to_move:  # white pawns take towards lower squares, 7 or 9 below their own
+            targets = self.color_bitboards["b"]
+            capturers = (targets & ~FILE_H) << 9 | (targets & ~FILE_A) << 7
+        else:
+            targets = self.color_bitboards["w"]
+            capturers = (targets & ~FILE_A) >> 9 | (targets & ~FILE_H) >> 7
+        if self.en_passant_possible != ():
+            ep_square = self.en_passant_possible[0] * 8 + self.en_passant_possible[1]
+            capturers |= PAWN_ATTACKS["b" if self.white_to_move else "w"][ep_square]
+        return capturers
+
+    """
+    Checks for pins and checks.
+    Pins map the square of each pinned piece to the squares it can still move to (along the pin, including the pinner),
+    checks is a bitboard of the enemy pieces giving check
     """
     def get_pins_and_checks(self):
-        pins = []
-        checks = []
-        in_check = False
         if self.white_to_move:
             ally_color = "w"
             enemy_color = "b"
-            start_row = self.white_king_location[0]
-            start_col = self.white_king_location[1]
+            king_square = self.white_king_location[0] * 8 + self.white_king_location[1]
         else:
             ally_color = "b"
             enemy_color = "w"
-            start_row = self.black_king_location[0]
-            start_col = self.black_king_location[1]
-        directions = [(-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]
-        for j in range(len(directions)):
-            d = directions[j]
-            possible_pin = ()  # reset possible pins
-            for i in range(1, 8):
-                end_row = start_row + d[0] * i
-                end_col = start_col + d[1] * i
-                if 0 <= end_row <= 7 and 0 <= end_col <= 7:
-                    end_piece = self.board[end_row][end_col]
-                    if end_piece[0] == ally_color and end_piece[1] != "K":
-                        if possible_pin == ():  # this is the first allied piece we have run into and could be pinned
-                            possible_pin = (end_row, end_col, d[0], d[1])
-                        else:  # this is the second allied piece in this direction and can't be pinned
-                            break
-                    elif end_piece[0] == enemy_color:
-                        piece_type = end_piece[1]
-                        # 5 possibilities
-                        # 1. Piece is a rook and is orthogonal to king
-                        # 2. Piece is a bishop and is diagonal to king
-                        # 3. Piece is a pawn and is one square away diagonally
-                        # 4. Piece is a queen and is any direction from king
-                        # 5. Piece is a king and is one square away in any direction
-                        if (0 <= j <= 3 and piece_type == "R") or \
-                           (4 <= j <= 7 and piece_type == "B") or \
-                           (i == 1 and piece_type == "P" and ((enemy_color == "w" and 6 <= j <= 7) or
-                                                              (enemy_color == "b" and 4 <= j <= 5))) or \
-                           (piece_type == "Q") or (i == 1 and piece_type == "K"):
-                            if possible_pin == ():  # there is no ally piece blocking check
-                                in_check = True
-                                checks.append((end_row, end_col, d[0], d[1]))
-                                break
-                            else:  # piece blocking check
-                                pins.append(possible_pin)
-                                break
-                        else:  # enemy piece not giving check
-                            break
-                else:  # off board
-                    break
-        # check for knight checks
-        knight_moves = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
-        for move in knight_moves:
-            end_row = start_row + move[0]
-            end_col = start_col + move[1]
-            if 0 <= end_row <= 7 and 0 <= end_col <= 7:
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] == enemy_color and end_piece[1] == "N":
-                    in_check = True
-                    checks.append((end_row, end_col, d[0], d[1]))
-        return in_check, pins, checks
-
-    """
-    Get all legal pawn moves located at a specific row and column
+            king_square = self.black_king_location[0] * 8 + self.black_king_location[1]
+        bitboards = self.bitboards
+        occupied = self.occupied
+        allies = self.color_bitboards[ally_color]
+        checks = (KNIGHT_ATTACKS[king_square] & bitboards[enemy_color + "N"]) | \
+                 (PAWN_ATTACKS[ally_color][king_square] & bitboards[enemy_color + "P"])
+        pins = {}
+        queens = bitboards[enemy_color + "Q"]
+        for rays, sliders in ((ROOK_RAYS, bitboards[enemy_color + "R"] | queens),
+                              (BISHOP_RAYS, bitboards[enemy_color + "B"] | queens)):
+            for table, positive in rays:
+                ray = table[king_square]
+                if not ray & sliders:  # nothing on this line can pin or check
+                    continue
+                blockers = ray & occupied
+                # walk out from the king: first piece on the ray, then the one behind it
+                first = (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+                if SQUARE_BB[first] & sliders:  # nothing blocking the check
+                    checks |= SQUARE_BB[first]
+                elif SQUARE_BB[first] & allies:  # the first allied piece we have run into could be pinned
+                    blockers ^= SQUARE_BB[first]
+                    if blockers:
+                        second = (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+                        if SQUARE_BB[second] & sliders:
+                            pins[first] = BETWEEN[king_square][second] | SQUARE_BB[second]
+        return checks != 0, pins, checks
+
+    """
+    Adds a Move from the square to every square in targets
+    """
+    def add_moves(self, square, targets, moves):
+        start = ROW_COL[square]
+        while targets:
+            target_bb = targets & -targets
+            targets ^= target_bb
+            moves.append(Move(start, ROW_COL[target_bb.bit_length() - 1], self.board))
+
+    """
+    Get all legal pawn moves located at a specific square
     """
     # TODO allow pawn to promote to something other than queen
-    def get_pawn_moves(self, row, col, moves):
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
-
+    def get_pawn_moves(self, square, moves):
+        allowed = self.pins.get(square, FULL) & self.check_mask
+        empty = ~self.occupied
         if self.white_to_move:  # white's turn => pawns move up the board
-            king_row, king_col = self.white_king_location
-            # check if there's a piece blocking the pawn from moving one square forward
-            if self.board[row - 1][col] == "--":
-                if not piece_pinned or pin_direction == (-1, 0):
-                    moves.append(Move((row, col), (row - 1, col), self.board))
-                    # if the pawn is on it's starting row it can move two squares forward if no pieces are blocking it
-                    if row == 6 and self.board[row - 2][col] == "--":
-                        moves.append(Move((row, col), (row - 2, col), self.board))
-            if col > 0:  # we are not on the left edge of the board
-                if self.board[row - 1][col - 1][0] == "b":  # there is a black piece to the left
-                    if not piece_pinned or pin_direction == (-1, -1):  # the pawn is not pinned or it is capturing the pinner
-                        moves.append(Move((row, col), (row - 1, col - 1), self.board))
-                elif (row - 1, col - 1) == self.en_passant_possible:  # check if en passant is possible
-                    attacking_piece = blocking_piece = False
-                    if king_row == row:
-                        if king_col < col:  # king col is less than col of pawn
-                            # inside is between king and pawn, outside is between pawn and board
-                            inside_range = range(king_col + 1, col - 1)
-                            outside_range = range(col + 1, 8)
-                        else:  # king is to the right of the pawn
-                            inside_range = range(king_col - 1, col, -1)
-                            outside_range = range(col - 2, -1, -1)
-                        for i in inside_range:
-                            if self.board[row][i] != "--":  # some other piece besides en-passant pawn is blocking
-                                blocking_piece = True
-                        for i in outside_range:
-                            square = self.board[row][i]
-                            if square[0] == "b" and (square[1] == "R" or square[1] == "Q"):
-                                attacking_piece = True
-                            elif square != "--":
-                                blocking_piece = True
-                    if not attacking_piece or blocking_piece:
-                        moves.append(Move((row, col), (row - 1, col - 1), self.board, en_passant_move=True))
-            if col < 7:  # we are not on the right edge of the board
-                if self.board[row - 1][col + 1][0] == "b":  # there is a black piece to the right
-                    if not piece_pinned or pin_direction == (-1, 1):  # pawn is not pinned or it is capturing the pinner
-                        moves.append(Move((row, col), (row - 1, col + 1), self.board))
-                elif (row - 1, col + 1) == self.en_passant_possible:  # check if en passant is possible
-                    attacking_piece = blocking_piece = False
-                    if king_row == row:
-                        if king_col < col:  # king col is less than col of pawn
-                            # inside is between king and pawn, outside is between pawn and board
-                            inside_range = range(king_col + 1, col)
-                            outside_range = range(col + 2, 8)
-                        else:  # king is to the right of the pawn
-                            inside_range = range(king_col - 1, col + 1, -1)
-                            outside_range = range(col - 1, -1, -1)
-                        for i in inside_range:
-                            if self.board[row][i] != "--":  # some other piece besides en-passant pawn is blocking
-                                blocking_piece = True
-                        for i in outside_range:
-                            square = self.board[row][i]
-                            if square[0] == "b" and (square[1] == "R" or square[1] == "Q"):
-                                attacking_piece = True
-                            elif square != "--":
-                                blocking_piece = True
-                    if not attacking_piece or blocking_piece:
-                        moves.append(Move((row, col), (row - 1, col + 1), self.board, en_passant_move=True))
-
-        elif not self.white_to_move:  # black's turn => pawns move down the board
-            king_row, king_col = self.black_king_location
-            # check if there's a piece blocking the pawn from moving one square forward
-            if self.board[row + 1][col] == "--":
-                if not piece_pinned or pin_direction == (1, 0):
-                    moves.append(Move((row, col), (row + 1, col), self.board))
-                    # if the pawn is on it's starting row it can move two squares forward if no pieces are blocking it
-                    if row == 1 and self.board[row + 2][col] == "--":
-                        moves.append(Move((row, col), (row + 2, col), self.board))
-            if col > 0:  # we are not on the left edge of the board
-                if self.board[row + 1][col - 1][0] == "w":  # there is a white piece to the left
-                    if not piece_pinned or pin_direction == (1, -1):  # the pawn is not pinned or it capturing the pinner
-                        moves.append(Move((row, col), (row + 1, col - 1), self.board))
-                elif (row + 1, col - 1) == self.en_passant_possible:  # check if en passant is possible
-                    attacking_piece = blocking_piece = False
-                    if king_row == row:
-                        if king_col < col:  # king col is less than col of pawn
-                            # inside is between king and pawn, outside is between pawn and board
-                            inside_range = range(king_col + 1, col - 1)
-                            outside_range = range(col + 1, 8)
-                        else:  # king is to the right of the pawn
-                            inside_range = range(king_col - 1, col, -1)
-                            outside_range = range(col - 2, -1, -1)
-                        for i in inside_range:
-                            if self.board[row][i] != "--":  # some other piece besides en-passant pawn is blocking
-                                blocking_piece = True
-                        for i in outside_range:
-                            square = self.board[row][i]
-                            if square[0] == "w" and (square[1] == "R" or square[1] == "Q"):
-                                attacking_piece = True
-                            elif square != "--":
-                                blocking_piece = True
-                    if not attacking_piece or blocking_piece:
-                        moves.append(Move((row, col), (row + 1, col - 1), self.board, en_passant_move=True))
-            if col < 7:  # we are not on the right edge of the board
-                if self.board[row + 1][col + 1][0] == "w":  # there is a white piece to the right
-                    if not piece_pinned or pin_direction == (1, 1):  # the pawn is not pinned or it is capturing the pinner
-                        moves.append(Move((row, col), (row + 1, col + 1), self.board))
-                elif (row + 1, col + 1) == self.en_passant_possible:  # check if en passant is possible
-                    attacking_piece = blocking_piece = False
-                    if king_row == row:
-                        if king_col < col:  # king col is less than col of pawn
-                            # inside is between king and pawn, outside is between pawn and board
-                            inside_range = range(king_col + 1, col)
-                            outside_range = range(col + 2, 8)
-                        else:  # king is to the right of the pawn
-                            inside_range = range(king_col - 1, col + 1, -1)
-                            outside_range = range(col - 1, -1, -1)
-                        for i in inside_range:
-                            if self.board[row][i] != "--":  # some other piece besides en-passant pawn is blocking
-                                blocking_piece = True
-                        for i in outside_range:
-                            square = self.board[row][i]
-                            if square[0] == "w" and (square[1] == "R" or square[1] == "Q"):
-                                attacking_piece = True
-                            elif square != "--":
-                                blocking_piece = True
-                    if not attacking_piece or blocking_piece:
-                        moves.append(Move((row, col), (row + 1, col + 1), self.board, en_passant_move=True))
-
-    """
-    Get all legal rook moves located at a specific row and column
-    """
-    # This function works by looking in a direction until it finds a piece in the way, adding moves along the way
-    def get_rook_moves(self, row, col, moves):
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                if self.board[row][col][1] != "Q":  # we don't want to remove moves from the list for queens
-                    self.pins.remove(self.pins[i])
-                break
-
-        rook_moves = [(1, 0), (0, 1), (-1, 0), (0, -1)]
-        opponent_color = "b" if self.white_to_move else "w"
-        for move in rook_moves:
-            for i in range(1, 8):
-                candidate_row = row + move[0] * i
-                candidate_col = col + move[1] * i
-                if 0 <= candidate_row <= 7 and 0 <= candidate_col <= 7:
-                    # If the piece is not pinned, or we are moving in the direction of the pin, or in the opposite
-                    # direction of the pin, it is a valid move
-                    if not piece_pinned or pin_direction == move or pin_direction == (-move[0], -move[1]):
-                        if self.board[candidate_row][candidate_col] == "--":  # move is to an empty square
-                            moves.append(Move((row, col), (candidate_row, candidate_col), self.board))
-                        elif self.board[candidate_row][candidate_col][0] == opponent_color:  # capture
-                            moves.append(Move((row, col), (candidate_row, candidate_col), self.board))
-                            break
-                        else:  # friendly piece
-                            break
-                else:  # not on board
-                    break
-
-    """
-    Get all legal bishop moves located at a specific row and column
-    """
-    def get_bishop_moves(self, row, col, moves):
-        #  same idea as rook moves: pick a direction and add moves until you hit a piece
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-
-        opponent_color = "b" if self.white_to_move else "w"
-        bishop_moves = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
-        for move in bishop_moves:
-            for i in range(1, 8):
-                candidate_row = row + move[0] * i
-                candidate_col = col + move[1] * i
-                if 0 <= candidate_row <= 7 and 0 <= candidate_col <= 7:  # check that square is on the board
-                    # If the piece is not pinned, or the piece wants to move either in the direction of the pin,
-                    # or the opposite direction of the pin, it is a valid move
-                    if not piece_pinned or pin_direction == move or pin_direction == (-move[0], -move[1]):
-                        if self.board[candidate_row][candidate_col] == "--":  # move to an empty square
-                            moves.append(Move((row, col), (candidate_row, candidate_col), self.board))
-                        elif self.board[candidate_row][candidate_col][0] == opponent_color:  # capture
-                            moves.append(Move((row, col), (candidate_row, candidate_col), self.board))
-                            break
-                        else:  # ally piece
-                            break
-                else:  # off the board
-                    break
-
-    """
-    Get all legal knight moves located at a specific row and column
-    """
-    def get_knight_moves(self, row, col, moves):
-        # we can simply test all eight possible knight moves for legality
-        # tuples of (row, column) give every possible knight move from a current position
-        piece_pinned = False
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                self.pins.remove(self.pins[i])
-                break
-
-        knight_moves = [(1, 2), (-1, 2), (1, -2), (2, 1), (-2, 1), (2, -1), (-2, -1), (-1, -2)]
-        ally_color = "w" if self.white_to_move else "b"
-        for move in knight_moves:
-            candidate_row = row + move[0]
-            candidate_col = col + move[1]
-            if 0 <= candidate_row <= 7 and 0 <= candidate_col <= 7:  # make sure the square is on the board
-                if not piece_pinned:
-                    if self.board[move[0] + row][move[1] + col][0] != ally_color:
-                        moves.append(Move((row, col), (candidate_row, candidate_col), self.board))
+            enemy_color = "b"
+            one_step = SQUARE_BB[square - 8] & empty if square >= 8 else 0
+            # if the pawn is on it's starting row it can move two squares forward if no pieces are blocking it
+            two_steps = SQUARE_BB[square - 16] & empty if one_step and square >= 48 else 0
+        else:  # black's turn => pawns move down the board
+            enemy_color = "w"
+            one_step = SQUARE_BB[square + 8] & empty if square < 56 else 0
+            two_steps = SQUARE_BB[square + 16] & empty if one_step and square < 16 else 0
+        attacks = PAWN_ATTACKS["w" if self.white_to_move else "b"][square]
+        self.add_moves(square, (one_step | two_steps | (attacks & self.color_bitboards[enemy_color])) & allowed, moves)
+
+        if self.en_passant_possible != () and not self.quiets_only:
+            ep_square = self.en_passant_possible[0] * 8 + self.en_passant_possible[1]
+            if attacks & SQUARE_BB[ep_square]:
+                captured_square = (square // 8) * 8 + ep_square % 8
+                # when in check the capture has to take the checking pawn or block the check
+                if self.check_mask & (SQUARE_BB[ep_square] | SQUARE_BB[captured_square]):
+                    # two pawns leave the rank at once, so test the resulting position for attacks on the king directly
+                    occupied = self.occupied ^ SQUARE_BB[square] ^ SQUARE_BB[captured_square] ^ SQUARE_BB[ep_square]
+                    king_location = self.white_king_location if self.white_to_move else self.black_king_location
+                    king_square = king_location[0] * 8 + king_location[1]
+                    queens = self.bitboards[enemy_color + "Q"]
+                    if not (slider_attacks(king_square, occupied, ROOK_RAYS) & (self.bitboards[enemy_color + "R"] | queens)) and \
+                       not (slider_attacks(king_square, occupied, BISHOP_RAYS) & (self.bitboards[enemy_color + "B"] | queens)):
+                        moves.append(Move(ROW_COL[square], ROW_COL[ep_square], self.board, en_passant_move=True))
 
     """
-    Get all legal queen moves located at a specific row and column
+    Get all legal rook moves located at a specific square
     """
-    def get_queen_moves(self, row, col, moves):
-        # The idea for queen moves is to combine the rook and bishop moves
-        self.get_bishop_moves(row, col, moves)
-        self.get_rook_moves(row, col, moves)
+    def get_rook_moves(self, square, moves):
+        allies = self.color_bitboards["w" if self.white_to_move else "b"]
+        targets = slider_attacks(square, self.occupied, ROOK_RAYS) & ~allies & self.check_mask
+        self.add_moves(square, targets & self.pins.get(square, FULL), moves)
 
     """
-    Get all legal king moves located at a specific row and column
+    Get all legal bishop moves located at a specific square
     """
-    def get_king_moves(self, row, col, moves):
-        row_moves = (-1, -1, -1, 0, 0, 1, 1, 1)
-        col_moves = (-1, 0, 1, -1, 1, -1, 0, 1)
-        ally_color = "w" if self.white_to_move else "b"
-        for i in range(8):
-            candidate_row = row + row_moves[i]
-            candidate_col = col + col_moves[i]
-            if 0 <= candidate_row <= 7 and 0 <= candidate_col <= 7:  # make sure the square is on the board
-                if self.board[candidate_row][candidate_col][0] != ally_color:
-                    # the idea here is to make the candidate move and see if it results in check
-                    if ally_color == "w":
-                        self.white_king_location = (candidate_row, candidate_col)
-                    else:
-                        self.black_king_location = (candidate_row, candidate_col)
-                    in_check, pins, checks = self.get_pins_and_checks()
-
-                    if not in_check:  # add to valid moves list
-                        moves.append(Move((row, col), (candidate_row, candidate_col), self.board))
-                    if ally_color == "w":  # move the king back
-                        self.white_king_location = (row, col)
-                    else:
-                        self.black_king_location = (row, col)
-
-    """
-    Get castling moves and add them to move list
+    def get_bishop_moves(self, square, moves):
+        allies = self.color_bitboards["w" if self.white_to_move else "b"]
+        targets = slider_attacks(square, self.occupied, BISHOP_RAYS) & ~allies & self.check_mask
+        self.add_moves(square, targets & self.pins.get(square, FULL), moves)
+
     """
-    def get_castle_moves(self, row, col, moves, ally_color):
-        if self.square_under_attack(row, col):  # can't castle if in check
+    Get all legal knight moves located at a specific square
+    """
+    def get_knight_moves(self, square, moves):
+        if square in self.pins:  # a pinned knight can never stay on the pin line
             return
-        if (self.white_to_move and self.current_castling_rights.wks) or \
-                (not self.white_to_move and self.current_castling_rights.bks):
-            self.get_kingside_castle_moves(row, col, moves, ally_color)
-        if (self.white_to_move and self.current_castling_rights.wqs) or \
-                (not self.white_to_move and self.current_castling_rights.bqs):
-            self.get_queenside_castle_moves(row, col, moves, ally_color)
+        allies = self.color_bitboards["w" if self.white_to_move else "b"]
+        self.add_moves(square, KNIGHT_ATTACKS[square] & ~allies & self.check_mask, moves)
 
-    def get_kingside_castle_moves(self, row, col, moves, ally_color):
-        if self.board[row][col + 1] == "--" and self.board[row][col + 2] == "--":
-            if not self.square_under_attack(row, col + 1) and not self.square_under_attack(row, col + 2):
-                moves.append(Move((row, col), (row, col + 2), self.board, is_castle_move=True))
+    """
+    Get all legal queen moves located at a specific square
+    """
+    def get_queen_moves(self, square, moves):
+        # The idea for queen moves is to combine the rook and bishop moves
+        self.get_bishop_moves(square, moves)
+        self.get_rook_moves(square, moves)
+
+    """
+    Get all legal king moves located at a specific square
+    """
+    def get_king_moves(self, square, moves):
+        ally_color, enemy_color = ("w", "b") if self.white_to_move else ("b", "w")
+        targets = KING_ATTACKS[square] & ~self.color_bitboards[ally_color] & self.target_mask
+        # take the king off the board so squares behind it along a checking line show up as attacked
+        occupied = self.occupied ^ SQUARE_BB[square]
+        start = ROW_COL[square]
+        while targets:
+            target_bb = targets & -targets
+            targets ^= target_bb
+            target = target_bb.bit_length() - 1
+            if not self.is_attacked(target, enemy_color, occupied):
+                moves.append(Move(start, ROW_COL[target], self.board))
 
-    def get_queenside_castle_moves(self, row, col, moves, ally_color):
-        if self.board[row][col - 1] == "--" and self.board[row][col - 2] == "--" and self.board[row][col - 3] == "--":
-            if not self.square_under_attack(row, col - 1) and not self.square_under_attack(row, col - 2) and not self.square_under_attack(row, col - 3):
-                moves.append(Move((row, col), (row, col - 2), self.board, is_castle_move=True))
+    """
+    Get castling moves and add them to move list.
+    Castling is only looked at when get_valid_moves knows the king isn't in check. The enemy attack map is built once,
+    and only if a castle is still allowed and the squares between king and rook are empty
+    """
+    def get_castle_moves(self, row, col, moves, ally_color):
+        if self.in_check:  # can't castle if in check
+            return
+        kingside = self.castling_rights & CASTLING_FLAGS[ally_color + "K"] and \
+            self.occupied & CASTLE_EMPTY[ally_color + "K"] == 0
+        queenside = self.castling_rights & CASTLING_FLAGS[ally_color + "Q"] and \
+            self.occupied & CASTLE_EMPTY[ally_color + "Q"] == 0
+        if not kingside and not queenside:
+            return
+        attacked = self.attack_map("b" if ally_color == "w" else "w")
+        if kingside:
+            self.get_kingside_castle_moves(row, col, moves, ally_color, attacked)
+        if queenside:
+            self.get_queenside_castle_moves(row, col, moves, ally_color, attacked)
 
+    def get_kingside_castle_moves(self, row, col, moves, ally_color, attacked):
+        if attacked & CASTLE_SAFE[ally_color + "K"] == 0:
+            moves.append(Move((row, col), (row, col + 2), self.board, is_castle_move=True))
 
-class CastleRights:
-    def __init__(self, wks, bks, wqs, bqs):
-        self.wks = wks
-        self.bks = bks
-        self.wqs = wqs
-        self.bqs = bqs
+    def get_queenside_castle_moves(self, row, col, moves, ally_color, attacked):
+        if attacked & CASTLE_SAFE[ally_color + "Q"] == 0:
+            moves.append(Move((row, col), (row, col - 2), self.board, is_castle_move=True))
 
 
 class Move:
+    """
+    Moves are made by the thousand for every searched position, so they only keep slots, no __dict__.
+    move_ID is start square | end square << 6 (squares numbered row * 8 + col), which is all two moves need to be equal
+    and all GameState.legal_move needs to rebuild the move on a board, so it is what gets stored and sent between
+    processes. move_log keeps the Move objects themselves: undo_move puts piece_captured back and the GUI and notation
+    read the other fields, none of which a move_ID holds
+    """
+    __slots__ = ("start_row", "start_col", "end_row", "end_col", "piece_moved", "piece_captured", "is_pawn_promotion",
+                 "en_passant_move", "is_capture", "is_castle_move", "move_ID", "is_check", "is_checkmate")
+
     # maps keys to values
     # key : value
     ranks_to_rows = {"1": 7, "2": 6, "3": 5, "4": 4,
@@ -624,22 +679,24 @@ class Move:
     cols_to_files = {v: k for k, v in files_to_cols.items()}
 
     def __init__(self, start_square, end_square, board, en_passant_move=False, is_castle_move=False, is_check=False, is_checkmate=False):
-        self.start_row = start_square[0]
-        self.start_col = start_square[1]
-        self.end_row = end_square[0]
-        self.end_col = end_square[1]
-        self.piece_moved = board[self.start_row][self.start_col]
-        self.piece_captured = board[self.end_row][self.end_col]
-        # pawn promotion
-        self.is_pawn_promotion = (self.piece_moved == "wP" and self.end_row == 0) or (self.piece_moved == "bP" and self.end_row == 7)
-        # en passant
+        # work in locals and assign each slot once, this runs for every generated move
+        start_row, start_col = start_square
+        end_row, end_col = end_square
+        piece_moved = board[start_row][start_col]
+        piece_captured = board[end_row][end_col]
+        if en_passant_move:
+            piece_captured = "wP" if piece_moved == "bP" else "bP"
+        self.start_row = start_row
+        self.start_col = start_col
+        self.end_row = end_row
+        self.end_col = end_col
+        self.piece_moved = piece_moved
+        self.piece_captured = piece_captured
+        self.is_pawn_promotion = piece_moved[1] == "P" and (end_row == 0 or end_row == 7)  # pawn promotion
         self.en_passant_move = en_passant_move
-        if self.en_passant_move:
-            self.piece_captured = "wP" if self.piece_moved == "bP" else "bP"
-        self.is_capture = self.piece_captured != "--"
-        # castle
+        self.is_capture = piece_captured != "--"
         self.is_castle_move = is_castle_move
-        self.move_ID = self.start_row * 1000 + self.start_col * 100 + self.end_row * 10 + self.end_col
+        self.move_ID = start_row * 8 + start_col | (end_row * 8 + end_col) << 6
         self.is_check = False
         self.is_checkmate = False
 
@@ -667,6 +724,14 @@ class Move:
     def get_rank_file(self, row, col):
         return self.cols_to_files[col] + self.rows_to_ranks[row]
 
+    """
+    Long algebraic notation as used by UCI e.g. e2e4, e1g1 for castling, e7e8q for a promotion
+    """
+    def get_long_algebraic(self):
+        promotion = "q" if self.is_pawn_promotion else ""
+        return self.get_rank_file(self.start_row, self.start_col) + self.get_rank_file(self.end_row, self.end_col) + \
+            promotion
+
     # overriding the str() function
     def __str__(self):
         # castle move
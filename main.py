@@ -4,18 +4,20 @@ Responsible for handling user input and current game state object
 
 import pygame as p
 import engine
-import smart_move_finder
-from multiprocessing import Process, Queue
+from search_worker import SearchWorker
 import sys
 
-p.init()
 BOARD_WIDTH = BOARD_HEIGHT = 512
 MOVE_LOG_PANEL_WIDTH = 250
 MOVE_LOG_PANEL_HEIGHT = BOARD_HEIGHT
 DIMENSION = 8
 SQ_SIZE = BOARD_HEIGHT // DIMENSION
 MAX_FPS = 15
+AI_WORKERS = 1  # processes the AI splits its search between, more than 1 uses the parallel search
+PONDER = True  # let the AI think on the human's time about the reply it expects
 IMAGES = {}
+FONTS = {}
+CLOCK_RECT = p.Rect(BOARD_WIDTH, BOARD_HEIGHT - 50, MOVE_LOG_PANEL_WIDTH, 25)  # the part of the panel the clock is in
 
 
 # TODO pre-moves, opening book,
@@ -140,6 +142,17 @@ def load_images():
     # Note: we can access an image by saying 'IMAGES['wP']'
 
 
+"""
+Fonts are created once and kept in a global dictionary, SysFont is too slow to call every frame
+"""
+
+
+def get_font(name, size, bold=False):
+    if (name, size, bold) not in FONTS:
+        FONTS[(name, size, bold)] = p.font.SysFont(name, size, bold, False)
+    return FONTS[(name, size, bold)]
+
+
 """
 The main driver for the game. This will handle user input and updating the graphics
 """
@@ -158,22 +171,26 @@ def main(player_one, time_control, increment, light_square_color, dark_square_co
     move_made = False  # flag variable for when a move is made
     animate = False  # flag variable for turning off animation
     load_images()
+    renderer = BoardRenderer(light_square_color, dark_square_color)
     square_selected = ()  # Tuple that keeps track of the last row/column the player selected (tuple: (row, col))
     player_clicks = []  # list that keeps track of two consecutive player clicks (two tuples: [(5, 4), (6, 8)])
     game_over = False
     premove = None
     player_two = not player_one  # True means human player
     AI_thinking = False
-    move_finder_process = None
+    AI_worker = SearchWorker(AI_WORKERS)  # searches in its own process and keeps its tables between moves
     move_undone = False
     time_since_last_tick = 0
     time_remaining = time_control
+    AI_time_remaining = time_control  # not drawn, but the AI budgets its thinking time from it
     light_square_color = light_square_color
     dark_square_color = dark_square_color
     lost_on_time = False
     running = True
     while running:
         if time_remaining <= 0.0:
+            if not lost_on_time:
+                AI_worker.cancel()  # stop pondering, the game is over
             time_remaining = 0
             game_over = True
             lost_on_time = True
@@ -181,6 +198,8 @@ def main(player_one, time_control, increment, light_square_color, dark_square_co
         human_turn = (gs.white_to_move and player_one) or (not gs.white_to_move and player_two)
         if human_turn and not game_over:
             time_remaining -= time_since_last_tick / 1000
+        elif AI_thinking:
+            AI_time_remaining -= time_since_last_tick / 1000
         for e in p.event.get():
             if e.type == p.QUIT:
                 running = False
@@ -242,9 +261,8 @@ def main(player_one, time_control, increment, light_square_color, dark_square_co
                     move_made = True
                     animate = False
                     game_over = False
-                    if AI_thinking:
-                        move_finder_process.terminate()
-                        AI_thinking = False
+                    AI_worker.cancel()  # stops the search or the pondering
+                    AI_thinking = False
                     move_undone = True
                 if e.key == p.K_r:  # restart the game when you press "r"
                     r.restart_requested = True
@@ -253,39 +271,47 @@ def main(player_one, time_control, increment, light_square_color, dark_square_co
         if not game_over and not human_turn and not move_undone and not r.restart_requested:
             if not AI_thinking:
                 AI_thinking = True
-                print("Thinking...")
-                return_queue = Queue()  # used to pass data between threads
-                move_finder_process = Process(target=smart_move_finder.find_best_move, args=(gs, valid_moves, return_queue))
-                move_finder_process.start()  # calls find_best_move in its own thread
-
-            if not move_finder_process.is_alive():
+                if AI_worker.ponder_hit(gs.move_log, AI_time_remaining):  # the search is already running
+                    print("Thinking... (ponder hit)")
+                else:
+                    print("Thinking...")
+                    AI_worker.start_search(gs.move_log, AI_time_remaining, increment)  # only sends the new moves
+
+            AI_move = AI_worker.get_result(valid_moves)
+            if AI_move is not None:
                 print("Done thinking")
-                AI_move = return_queue.get()
-                if AI_move is None:
-                    AI_move = smart_move_finder.find_random_move(valid_moves)
                 gs.make_move(AI_move)
+                AI_time_remaining += increment
                 move_made = True
                 animate = True
                 AI_thinking = False
+                if PONDER and AI_worker.start_ponder(gs.move_log, increment):
+                    print("Pondering...")
 
         if move_made:
             if animate:
-                animate_move(gs.move_log[-1], screen, gs.board, clock, light_square_color, dark_square_color)
+                animate_move(gs.move_log[-1], screen, gs.board, clock, renderer)
             valid_moves = gs.get_valid_moves()
             move_made = False
             animate = False
             move_undone = False
 
-        draw_game_state(screen, gs, valid_moves, square_selected, move_log_font, time_remaining, light_square_color, dark_square_color)
-
+        end_game_text = None
         if lost_on_time:
-            text = "White wins on time" if not gs.white_to_move else "Black wins on time"
-            draw_end_game_text(screen, text)
+            end_game_text = "White wins on time" if not gs.white_to_move else "Black wins on time"
 
         if gs.checkmate or gs.stalemate:
+            if not game_over:
+                AI_worker.cancel()  # stop pondering, the game is over
             game_over = True
-            text = "Stalemate" if gs.stalemate else "Black wins by checkmate" if gs.white_to_move else "White wins by checkmate"
-            draw_end_game_text(screen, text)
+            end_game_text = "Stalemate" if gs.stalemate else "Black wins by checkmate" if gs.white_to_move else "White wins by checkmate"
+
+        dirty_rects = renderer.draw(screen, gs, valid_moves, square_selected, move_log_font, time_remaining,
+                                    (end_game_text, r.restart_requested))
+
+        # the overlays go on top every frame, so any square redrawn under them is covered again
+        if end_game_text is not None:
+            draw_end_game_text(screen, end_game_text)
 
         if r.restart_requested:
             r.draw_game_restart_confirmation(screen)
@@ -298,33 +324,103 @@ def main(player_one, time_control, increment, light_square_color, dark_square_co
             move_made = False
             animate = False
             game_over = False
-            if AI_thinking:
-                move_finder_process.terminate()
-                AI_thinking = False
+            AI_worker.reset()
+            AI_thinking = False
             move_undone = True
             lost_on_time = False
             r.restart_confirmed = False
             time_remaining = time_control
+            AI_time_remaining = time_control
 
         time_since_last_tick = clock.tick(MAX_FPS)
-        p.display.flip()
+        if dirty_rects is None:
+            p.display.flip()
+        elif dirty_rects:  # an empty list means nothing changed this frame
+            p.display.update(dirty_rects)
 
+    AI_worker.stop()
     p.quit()  # quits pygame
     sys.exit()
 
 
 """
-Responsible for all graphics in the current game state
+Responsible for all graphics in the current game state. Remembers what is on the screen so a frame only redraws what
+changed since the last one: the squares whose piece or highlight changed, the side panel when the move log or material
+changes and the clock when its text does. The empty board is drawn once onto a background surface and squares are
+copied from it.
+draw returns the rects to pass to p.display.update, or None after a full redraw, when the display should be flipped
 """
 
 
-def draw_game_state(screen, gs, valid_moves, square_selected, move_log_font, time_remaining, light_square_color, dark_square_color):
-    draw_board(screen, light_square_color, dark_square_color)  # draw squares on the board
-    highlight_squares(screen, gs, valid_moves, square_selected)  # highlight squares
-    draw_pieces(screen, gs.board)  # draw pieces on squares
-    draw_move_log(screen, gs, move_log_font)
-    draw_material_count(screen, smart_move_finder, gs)
-    draw_clock(screen, time_remaining)
+class BoardRenderer:
+    def __init__(self, light_square_color, dark_square_color):
+        self.background = p.Surface((BOARD_WIDTH, BOARD_HEIGHT))
+        draw_board(self.background, light_square_color, dark_square_color)
+        self.highlight = p.Surface((SQ_SIZE, SQ_SIZE))
+        self.highlight.set_alpha(100)  # set the transparency: 0 = transparent, 255 = opaque
+        self.squares = [None] * (DIMENSION * DIMENSION)  # (piece, highlight colors) each square was drawn with
+        self.panel = None  # (move count, last move, material) the side panel was drawn with
+        self.clock_text = None
+        self.overlay = None  # whatever is drawn over the board, see main
+        self.full_redraw = True
+
+    def invalidate(self):
+        self.squares = [None] * (DIMENSION * DIMENSION)
+        self.panel = None
+        self.clock_text = None
+        self.full_redraw = True
+
+    """
+    Forgets the squares inside rect, something else has drawn over them
+    """
+    def forget(self, rect):
+        for row in range(DIMENSION):
+            for col in range(DIMENSION):
+                if rect.colliderect(p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)):
+                    self.squares[row * DIMENSION + col] = None
+
+    def draw(self, screen, gs, valid_moves, square_selected, move_log_font, time_remaining, overlay=None):
+        if overlay != self.overlay:  # the end game text or the restart box came or went
+            self.overlay = overlay
+            self.invalidate()
+        dirty_rects = []
+        highlights = square_highlights(gs, valid_moves, square_selected)
+        for row in range(DIMENSION):
+            for col in range(DIMENSION):
+                square = row * DIMENSION + col
+                state = (gs.board[row][col], highlights.get(square, ()))
+                if state != self.squares[square]:
+                    self.squares[square] = state
+                    dirty_rects.append(self.draw_square(screen, row, col, *state))
+
+        panel = (len(gs.move_log), gs.move_log[-1] if gs.move_log else None, gs.material)
+        if panel != self.panel:
+            self.panel = panel
+            self.clock_text = None  # the panel is cleared, clock included
+            draw_move_log(screen, gs, move_log_font)
+            draw_material_count(screen, gs)
+            dirty_rects.append(p.Rect(BOARD_WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT))
+        text = clock_text(time_remaining)
+        if text != self.clock_text:
+            self.clock_text = text
+            p.draw.rect(screen, p.Color("black"), CLOCK_RECT)
+            draw_clock(screen, time_remaining)
+            dirty_rects.append(CLOCK_RECT)
+
+        if self.full_redraw:
+            self.full_redraw = False
+            return None
+        return dirty_rects
+
+    def draw_square(self, screen, row, col, piece, highlight_colors):
+        square_rect = p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+        screen.blit(self.background, square_rect, square_rect)
+        for color in highlight_colors:
+            self.highlight.fill(p.Color(color))
+            screen.blit(self.highlight, square_rect)
+        if piece != "--":  # not an empty square
+            screen.blit(IMAGES[piece], square_rect)
+        return square_rect
 
 
 """
@@ -333,7 +429,6 @@ Draw the squares on the board
 
 
 def draw_board(screen, light_square_color, dark_square_color):
-    global colors
     # TODO implement alternate color choices
     colors = [light_square_color, dark_square_color]
     for row in range(DIMENSION):
@@ -343,43 +438,38 @@ def draw_board(screen, light_square_color, dark_square_color):
 
 
 """
-Highlight the square selected and possible moves for the piece selected
+The highlights of every highlighted square, in the order they are drawn: the square selected and possible moves for
+the piece selected, then the square of the piece that last moved
 """
 
 
-def highlight_squares(screen, gs, valid_moves, square_selected):
+def square_highlights(gs, valid_moves, square_selected):
     # TODO change highlighting last piece moved
+    highlights = {}  # row * DIMENSION + col -> tuple of colors
     if square_selected != ():  # check that the square has a piece
         row, col = square_selected
         if gs.board[row][col][0] == ("w" if gs.white_to_move else "b"):  # check that the piece selected is not an enemy piece
-            # highlight selected square
-            s = p.Surface((SQ_SIZE, SQ_SIZE))
-            s.set_alpha(100)  # set the transparency: 0 = transparent, 255 = opaque
-            s.fill(p.Color('blue'))
-            screen.blit(s, (col * SQ_SIZE, row * SQ_SIZE))
-            # highlight moves from that square
-            s.fill(p.Color('yellow'))
+            highlights[row * DIMENSION + col] = ("blue",)
             for move in valid_moves:
                 if move.start_row == row and move.start_col == col:
-                    screen.blit(s, (SQ_SIZE * move.end_col, SQ_SIZE * move.end_row))
+                    square = move.end_row * DIMENSION + move.end_col
+                    highlights[square] = highlights.get(square, ()) + ("yellow",)
 
-    # highlight the square of the piece that last moved
     if gs.move_log:  # make sure the move log is not empty
         last_move = gs.move_log[-1]  # get the last move
-        s = p.Surface((SQ_SIZE, SQ_SIZE))
-        s.fill(p.Color('yellow'))
-        s.set_alpha(100)
-        screen.blit(s, (SQ_SIZE * last_move.end_col, SQ_SIZE * last_move.end_row))
+        square = last_move.end_row * DIMENSION + last_move.end_col
+        highlights[square] = highlights.get(square, ()) + ("yellow",)
+    return highlights
 
 
 """
-Draw the pieces on the board
+Draw the pieces on the board, or on the squares in rows and cols
 """
 
 
-def draw_pieces(screen, board):
-    for row in range(DIMENSION):
-        for col in range(DIMENSION):
+def draw_pieces(screen, board, rows=range(DIMENSION), cols=range(DIMENSION)):
+    for row in rows:
+        for col in cols:
             piece = board[row][col]
             if piece != "--":  # not an empty square
                 screen.blit(IMAGES[piece], p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE))
@@ -416,33 +506,34 @@ def draw_move_log(screen, gs, move_log_font):
         textY += text_object.get_height() + line_spacing
 
 
-def draw_material_count(screen, smart_move_finder, gs):
-    material_count = str(smart_move_finder.score_board(gs))
-    font = p.font.SysFont("Helvetica", 14, True, False)
+def draw_material_count(screen, gs):
+    material_count = str(gs.material)
+    font = get_font("Helvetica", 14, True)
     text_object = font.render("Material Count: " + material_count, 1, p.Color("White"))
     text_location = p.Rect(BOARD_WIDTH + 15, BOARD_HEIGHT - 25, 50, 50)
     screen.blit(text_object, text_location)
 
 
 """
-animating a move
+animating a move. Only the rectangle spanned by the start and end squares is redrawn and sent to the display
 """
 
 
-def animate_move(move, screen, board, clock, light_square_color, dark_square_color):
-    global colors
+def animate_move(move, screen, board, clock, renderer):
     dr = move.end_row - move.start_row
     dc = move.end_col - move.start_col
     frames_per_square = 2  # frames to move one square
     frame_count = (abs(dr) + abs(dc)) * frames_per_square
+    rows = range(min(move.start_row, move.end_row), max(move.start_row, move.end_row) + 1)
+    cols = range(min(move.start_col, move.end_col), max(move.start_col, move.end_col) + 1)
+    area = p.Rect(cols[0] * SQ_SIZE, rows[0] * SQ_SIZE, len(cols) * SQ_SIZE, len(rows) * SQ_SIZE)
     for frame in range(frame_count + 1):
         row, col = (move.start_row + dr * frame / frame_count, move.start_col + dc * frame / frame_count)
-        draw_board(screen, light_square_color, dark_square_color)
-        draw_pieces(screen, board)
+        screen.blit(renderer.background, area, area)
+        draw_pieces(screen, board, rows, cols)
         # erase the piece from its end square
-        color = colors[(move.end_row + move.end_col) % 2]
         end_square = p.Rect(move.end_col * SQ_SIZE, move.end_row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-        p.draw.rect(screen, color, end_square)
+        screen.blit(renderer.background, end_square, end_square)
         # draw captured piece onto rectangle
         if move.piece_captured != "--":
             if move.en_passant_move:
@@ -451,8 +542,9 @@ def animate_move(move, screen, board, clock, light_square_color, dark_square_col
             screen.blit(IMAGES[move.piece_captured], end_square)
         # draw moving piece
         screen.blit(IMAGES[move.piece_moved], p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-        p.display.flip()
+        p.display.update(area)
         clock.tick(60)
+    renderer.forget(area)  # drawn without highlights, the next frame redraws those squares
 
 
 """
@@ -498,13 +590,13 @@ class Restart:
         p.draw.rect(screen, no_color, self.no_button)
 
         # confirmation text
-        font = p.font.SysFont("Helvetica", 14, True, False)
+        font = get_font("Helvetica", 14, True)
         text_object = font.render("Are you sure you want to restart?", 1, p.Color("White"))
         text_location = (box_x + 12, box_y + box_y//8)
         screen.blit(text_object, text_location)
 
         # yes text
-        font = p.font.SysFont("Helvetica", 14, True, False)
+        font = get_font("Helvetica", 14, True)
         text_object = font.render("Yes", 1, p.Color("Black"))
         text_location = (yes_x + yes_width//4, yes_y + yes_height//4)
         screen.blit(text_object, text_location)
@@ -528,15 +620,19 @@ draw the time clock
 
 
 def draw_clock(screen, time_remaining):
+    time_remaining_str = clock_text(time_remaining)
+    font = get_font("Helvetica", 14, True)
+    text_object = font.render(time_remaining_str, 1, p.Color("White"))
+    text_location = (BOARD_WIDTH + 15, BOARD_HEIGHT-50)
+    screen.blit(text_object, text_location)
+
+
+def clock_text(time_remaining):
     if time_remaining <= 0.0:
         time_remaining = 0
     m, s = divmod(time_remaining, 60)
     m, s = int(m//1), round(s, 1)
-    time_remaining_str = str(m) + ":" + str(s)
-    font = p.font.SysFont("Helvetica", 14, True, False)
-    text_object = font.render(time_remaining_str, 1, p.Color("White"))
-    text_location = (BOARD_WIDTH + 15, BOARD_HEIGHT-50)
-    screen.blit(text_object, text_location)
+    return str(m) + ":" + str(s)
 
 
 """
@@ -545,7 +641,7 @@ draws the text on the screen after the game is over
 
 
 def draw_end_game_text(screen, text):
-    font = p.font.SysFont("Helvetica", 32, True, False)
+    font = get_font("Helvetica", 32, True)
     text_object = font.render(text, 0, p.Color("Black"))
     text_location = p.Rect(0, 0, BOARD_WIDTH, BOARD_HEIGHT).move(BOARD_WIDTH / 2 - text_object.get_width() / 2, BOARD_HEIGHT / 2 - text_object.get_height() / 2)
     screen.blit(text_object, text_location.move(2, 2))
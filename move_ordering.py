@@ -0,0 +1,98 @@
+"""
+Orders moves best to worst before the alpha beta search tries them. The sooner the best move is searched the more of
+the remaining moves get cut off, so a good ordering is worth several times fewer nodes at the same depth.
+Order: hash move from the transposition table, captures by MVV-LVA (most valuable victim, least valuable attacker),
+killer moves, then quiet moves by their history score.
+Inside the tree the moves are generated in the same stages (see staged_moves), most nodes cut off after the first
+one or two moves and never need the rest
+"""
+
+MAX_PLY = 128
+# piece ranks for MVV-LVA, only the order matters
+ORDER_VALUES = {"P": 1, "N": 2, "B": 3, "R": 4, "Q": 5, "K": 6}
+
+HASH_MOVE_SCORE = 1000000
+CAPTURE_SCORE = 100000
+KILLER_SCORE = 90000  # second killer gets one less
+HISTORY_LIMIT = 80000  # keeps history scores below the killers
+
+
+"""
+Index of a move in the history table, move_ID already numbers every from/to pair below 4096
+"""
+
+
+def history_index(move):
+    return move.move_ID
+
+
+class MoveOrderer:
+    def __init__(self):
+        self.killers = [[None, None] for _ in range(MAX_PLY)]  # move_IDs of the last two quiet cutoff moves per ply
+        self.history = [0] * 4096  # how often (weighted by depth) each from/to quiet move caused a cutoff
+
+    """
+    Killers only make sense within one search. History is kept, but halved so it follows the new position
+    """
+    def new_search(self):
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = [score // 2 for score in self.history]
+
+    def score_move(self, move, hash_move_id, killers):
+        if move.move_ID == hash_move_id:
+            return HASH_MOVE_SCORE
+        if move.is_capture or move.is_pawn_promotion:
+            score = CAPTURE_SCORE
+            if move.is_capture:
+                score += 10 * ORDER_VALUES[move.piece_captured[1]] - ORDER_VALUES[move.piece_moved[1]]
+            if move.is_pawn_promotion:
+                score += 10 * ORDER_VALUES["Q"]
+            return score
+        if move.move_ID == killers[0]:
+            return KILLER_SCORE
+        if move.move_ID == killers[1]:
+            return KILLER_SCORE - 1
+        return self.history[history_index(move)]
+
+    """
+    Sorts the moves in place, best first. The sort is stable so equally scored moves keep their order.
+    hash_move_id is the move_ID of the best move stored in the transposition table, or None
+    """
+    def order_moves(self, moves, hash_move_id, ply):
+        killers = self.killers[ply] if ply < MAX_PLY else [None, None]
+        moves.sort(key=lambda move: self.score_move(move, hash_move_id, killers), reverse=True)
+        return moves
+
+    """
+    Yields the legal moves of the position best first, one stage at a time: the hash move (checked with
+    GameState.legal_move), the captures by MVV-LVA, then the quiet moves with promotions, killers and history first.
+    A stage is only generated once the search comes back for more, so a cutoff leaves the later ones ungenerated.
+    The search makes and undoes moves between yields, every stage regenerates the pins and checks it needs
+    """
+    def staged_moves(self, gs, hash_move_id, ply):
+        if hash_move_id is not None:
+            hash_move = gs.legal_move(hash_move_id)
+            if hash_move is not None:
+                yield hash_move
+        for captures_only in (True, False):
+            moves = gs.get_valid_moves(captures_only=captures_only, quiets_only=not captures_only)
+            self.order_moves(moves, None, ply)
+            for move in moves:
+                if move.move_ID != hash_move_id:
+                    yield move
+
+    """
+    Called when a move causes a beta cutoff. Captures are already ordered well by MVV-LVA so only quiet moves are kept
+    """
+    def record_cutoff(self, move, depth, ply):
+        if move.is_capture or move.is_pawn_promotion:
+            return
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move.move_ID:
+                killers[1] = killers[0]
+                killers[0] = move.move_ID
+        index = history_index(move)
+        self.history[index] += depth * depth
+        if self.history[index] > HISTORY_LIMIT:  # scale everything down so the relative order is kept
+            self.history = [score // 2 for score in self.history]
@@ -0,0 +1,232 @@
+"""
+Multi-core search by splitting the root. Every iteration of the iterative deepening deals the root moves out to a pool
+of helper processes, each helper searches its share to the same depth, and the best of their answers is kept.
+The previous iteration's best move always goes to the first helper so it gets searched right away.
+Helpers keep their own GameState in sync from the move list the same way the search worker does, and all of them
+search with one SharedTranspositionTable, so a position one helper has already searched is a hit for the rest.
+
+usage: python parallel_search.py [--workers N] [--depth D | --time SECONDS] [--fen FEN] [--profile timers|cprofile]
+    compares against the single process search and reports per-helper nodes and the speedup
+"""
+
+import argparse
+from array import array
+from multiprocessing import Process, Queue, Value
+import os
+import queue
+import random
+import time
+import engine
+import profiling
+import smart_move_finder
+from shared_transposition_table import SharedTranspositionTable
+from search_worker import move_ids, find_move, next_request
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+
+"""
+Runs in each helper process until a "quit" request arrives.
+Requests: ("search", search_id, fen, moves, depth, root_moves, time_budget) where fen is the start position (None for
+the standard one) and moves are the move_IDs played from it. Results: (search_id, index, move_ID, score, nodes)
+"""
+
+
+def helper_loop(index, request_queue, result_queue, current_search_id, transposition_table):
+    profiling.install()
+    smart_move_finder.transposition_table = transposition_table
+    gs = engine.GameState()
+    start_fen = None
+    synced_moves = array("H")
+    while True:
+        request = next_request(request_queue)
+        if request[0] == "quit":
+            transposition_table.close()
+            break
+        search_id, fen, moves, depth, root_moves, time_budget = request[1:]
+        if fen != start_fen:
+            gs = engine.GameState()
+            if fen is not None:
+                gs.load_fen(fen)
+            start_fen = fen
+            synced_moves = array("H")
+        common = 0
+        while common < len(moves) and common < len(synced_moves) and moves[common] == synced_moves[common]:
+            common += 1
+        for _ in range(len(synced_moves) - common):
+            gs.undo_move()
+        for move in moves[common:]:
+            gs.make_move(find_move(gs.get_valid_moves(), move))
+        new_position = moves != synced_moves or depth == 1
+        synced_moves = moves
+        if current_search_id.value != search_id:  # cancelled while waiting in the queue
+            result_queue.put((search_id, index, None, None, 0))
+            continue
+        valid_moves = gs.get_valid_moves()
+        smart_move_finder.should_stop = lambda: current_search_id.value != search_id
+        best_move, score, nodes = smart_move_finder.search_root_moves(
+            gs, [find_move(valid_moves, move) for move in root_moves], depth, time_budget, new_position)
+        smart_move_finder.should_stop = None
+        result_queue.put((search_id, index, best_move.move_ID if best_move is not None else None, score, nodes))
+
+
+class ParallelSearch:
+    def __init__(self, worker_count=DEFAULT_WORKERS):
+        self.worker_count = worker_count
+        self.request_queues = [Queue() for _ in range(worker_count)]
+        self.result_queue = Queue()
+        self.current_search_id = Value("i", 0, lock=False)
+        self.worker_nodes = [0] * worker_count  # nodes each helper searched during the last find_best_move
+        self.depth_reached = 0  # last depth the helpers all finished during the last find_best_move
+        self.transposition_table = SharedTranspositionTable(smart_move_finder.TT_SIZE_MB)
+        self.processes = [Process(target=helper_loop, daemon=True,
+                                  args=(i, self.request_queues[i], self.result_queue, self.current_search_id,
+                                        self.transposition_table))
+                          for i in range(worker_count)]
+        for process in self.processes:
+            process.start()
+
+    """
+    Same idea as smart_move_finder.find_best_move: a book move if there is one, then a fixed depth search without a
+    clock, otherwise iterative deepening within the time budget. should_stop is polled while waiting on the helpers so
+    the caller can cancel
+    """
+    def find_best_move(self, gs, valid_moves, time_remaining=None, increment=0, start_fen=None, should_stop=None):
+        if len(valid_moves) == 0:  # checkmate or stalemate, nothing to search
+            return None
+        book_move = smart_move_finder.find_book_move(gs, valid_moves)
+        if book_move is not None:
+            print("Book move:", book_move)
+            return book_move
+        if time_remaining is None:
+            time_budget = None
+            max_depth = smart_move_finder.DEPTH
+        else:
+            time_budget = smart_move_finder.get_time_budget(time_remaining, increment)
+            max_depth = smart_move_finder.MAX_DEPTH
+        moves = move_ids(gs.move_log)
+        root_moves = [move.move_ID for move in valid_moves]
+        random.shuffle(root_moves)  # to allow for variation in games with AI
+        self.worker_nodes = [0] * self.worker_count
+        self.depth_reached = 0
+        self.transposition_table.advance_age()
+        start_time = time.perf_counter()
+        best_move = None
+        for depth in range(1, max_depth + 1):
+            if best_move is not None:
+                root_moves.remove(best_move)
+                root_moves.insert(0, best_move)
+            self.current_search_id.value += 1
+            search_id = self.current_search_id.value
+            remaining = time_budget - (time.perf_counter() - start_time) if time_budget is not None else None
+            shares = [root_moves[i::self.worker_count] for i in range(self.worker_count)]
+            sent = 0
+            for i, share in enumerate(shares):
+                if share:
+                    self.request_queues[i].put(("search", search_id, start_fen, moves, depth, share, remaining))
+                    sent += 1
+            results = self.collect_results(search_id, sent, should_stop)
+            if results is None or any(result[1] is None for result in results):
+                self.current_search_id.value += 1  # stop the helpers that are still going
+                break  # an unfinished iteration can't be trusted, keep the last complete one
+            best_move, score = max(results, key=lambda result: result[1])
+            self.depth_reached = depth
+            elapsed = time.perf_counter() - start_time
+            print("depth", depth, "best move:", find_move(valid_moves, best_move), "score:", score,
+                  "time:", round(elapsed, 2))
+            if abs(score) >= smart_move_finder.CHECKMATE:
+                break
+            if time_budget is not None and elapsed > time_budget / 2:
+                break
+        for i, nodes in enumerate(self.worker_nodes):
+            print("worker", i, "nodes:", nodes)
+        return find_move(valid_moves, best_move) if best_move is not None else None
+
+    """
+    Waits for every helper's (move, score) for this search, or returns None if should_stop asks to give up.
+    A helper that was stopped before finishing its share answers with a score of None
+    """
+    def collect_results(self, search_id, count, should_stop):
+        results = []
+        while len(results) < count:
+            if should_stop is not None and should_stop():
+                return None
+            try:
+                result_id, index, move, score, nodes = self.result_queue.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            if result_id == search_id:  # anything else is left over from a cancelled search
+                self.worker_nodes[index] += nodes
+                results.append((move, score))
+        return results
+
+    def cancel(self):
+        self.current_search_id.value += 1
+
+    def stop(self):
+        self.cancel()
+        for request_queue in self.request_queues:
+            request_queue.put(("quit",))
+        for process in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        self.transposition_table.close(unlink=True)
+
+
+"""
+Searches the same position with one process and with the pool and prints the comparison: the speedup for a fixed
+depth, the depth each one reached for a fixed time
+"""
+
+
+def benchmark(fen, worker_count, depth=None, seconds=None):
+    gs = engine.GameState()
+    if fen is not None:
+        gs.load_fen(fen)
+    # a clock that makes get_time_budget come out at the requested number of seconds
+    time_remaining = seconds * smart_move_finder.MOVES_TO_GO if seconds is not None else None
+    if depth is not None:
+        smart_move_finder.DEPTH = depth
+    smart_move_finder.USE_BOOK = False  # compare searches, not book lookups
+    # start the helpers first so they don't inherit the tables the single process search fills
+    pool = ParallelSearch(worker_count)
+
+    begin_time = time.perf_counter()
+    smart_move_finder.find_best_move(gs, gs.get_valid_moves(), None, time_remaining)
+    single_time = time.perf_counter() - begin_time
+    single_nodes = smart_move_finder.stats.total_nodes()
+    single_depth = smart_move_finder.stats.iterations[-1]["depth"] if smart_move_finder.stats.iterations else 0
+
+    begin_time = time.perf_counter()
+    pool.find_best_move(gs, gs.get_valid_moves(), time_remaining, start_fen=fen)
+    parallel_time = time.perf_counter() - begin_time
+    pool.stop()
+
+    print()
+    print("single process:", single_nodes, "nodes in", round(single_time, 3), "s, depth", single_depth)
+    print(worker_count, "workers:", sum(pool.worker_nodes), "nodes in", round(parallel_time, 3), "s, depth",
+          pool.depth_reached)
+    for i, nodes in enumerate(pool.worker_nodes):
+        print("  worker", i, "nodes:", nodes)
+    if depth is not None:
+        print("speedup: ", round(single_time / parallel_time, 2))
+    else:
+        print("depth reached in", seconds, "s: ", single_depth, "single process,", pool.depth_reached, "with",
+              worker_count, "workers")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the parallel search against a single process")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--depth", type=int, default=None, help="search to a fixed depth (default 3)")
+    parser.add_argument("--time", type=float, default=None, help="search with a time budget in seconds instead")
+    parser.add_argument("--fen", default=None, help="position to search (default: start position)")
+    parser.add_argument("--profile", choices=profiling.PROFILE_MODES, default=None,
+                        help="profile the searches, every process writes its own report (see profiling.py)")
+    args = parser.parse_args()
+    if args.profile is not None:
+        profiling.enable(args.profile)
+    else:
+        profiling.install()  # only if CHESS_PROFILE is set
+    benchmark(args.fen, args.workers, args.depth if args.time is None else None, args.time)
@@ -0,0 +1,161 @@
+"""
+Perft (performance test) for the move generator.
+Walks the game tree to a fixed depth with get_valid_moves/make_move/undo_move and counts the leaf nodes, which can be
+compared against published counts for well known positions. Doubles as a benchmark for move generation speed.
+
+usage: python perft.py [--fen FEN] [--depth N] [--divide] [--check] [--profile timers|cprofile]
+       python perft.py --suite [--depth N]
+"""
+
+import argparse
+import time
+import engine
+import profiling
+import zobrist
+from evaluation import MATERIAL, POSITIONAL
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# name -> (fen, leaf counts for depth 1, 2, ...)
+# the engine always promotes to a queen, so only depths where no promotion has happened yet are listed
+REFERENCE_POSITIONS = {
+    "start": (START_FEN, [20, 400, 8902, 197281, 4865609]),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862]),
+    "position3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    "position4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6]),
+    "position4_mirrored": ("r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1", [6]),
+    "position6": ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079, 89890]),
+}
+
+
+"""
+Counts the leaf nodes of the game tree below the current position
+"""
+
+
+def perft(gs, depth, check=False):
+    moves = gs.get_valid_moves()
+    if depth == 1 and not check:
+        return len(moves)  # no need to play the last moves out just to count them
+    nodes = 0
+    for move in moves:
+        if check:
+            before = position_snapshot(gs)
+        gs.make_move(move)
+        if check and gs.zobrist_key != zobrist.compute_key(gs):
+            raise AssertionError("make_move left the wrong hash after " + str(move))
+        if check and (gs.material, gs.positional) != count_scores(gs):
+            raise AssertionError("make_move left the wrong material/positional score after " + str(move))
+        nodes += perft(gs, depth - 1, check) if depth > 1 else 1
+        gs.undo_move()
+        if check and position_snapshot(gs) != before:
+            raise AssertionError("undo_move did not restore the position after " + str(move))
+    return nodes
+
+
+"""
+Perft split up by root move, useful for tracking down which move a wrong count comes from
+"""
+
+
+def divide(gs, depth, check=False):
+    counts = {}
+    for move in gs.get_valid_moves():
+        gs.make_move(move)
+        counts[move.get_rank_file(move.start_row, move.start_col) + move.get_rank_file(move.end_row, move.end_col)] = \
+            perft(gs, depth - 1, check) if depth > 1 else 1
+        gs.undo_move()
+    return counts
+
+
+"""
+Everything make_move/undo_move are responsible for restoring
+"""
+
+
+def position_snapshot(gs):
+    return (tuple(tuple(row) for row in gs.board), gs.white_to_move, gs.white_king_location, gs.black_king_location,
+            gs.castling_rights, gs.en_passant_possible, gs.halfmove_clock,
+            tuple(sorted(gs.bitboards.items())), tuple(sorted(gs.color_bitboards.items())), gs.occupied,
+            gs.zobrist_key, gs.material, gs.positional, len(gs.move_log))
+
+
+"""
+Material and piece-square totals counted from the board, to compare against the incrementally updated ones
+"""
+
+
+def count_scores(gs):
+    material = positional = 0
+    for row in range(8):
+        for col in range(8):
+            piece = gs.board[row][col]
+            if piece != "--":
+                material += MATERIAL[piece]
+                positional += POSITIONAL[piece][row * 8 + col]
+    return material, positional
+
+
+"""
+Runs perft on a position and prints the node count and speed
+"""
+
+
+def run(fen, depth, show_divide=False, check=False):
+    gs = engine.GameState()
+    gs.load_fen(fen)
+    begin_time = time.perf_counter()
+    if show_divide:
+        counts = divide(gs, depth, check)
+        for move in sorted(counts):
+            print(move + ": " + str(counts[move]))
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(gs, depth, check)
+    execution_time = time.perf_counter() - begin_time
+    print("depth " + str(depth) + ": " + str(nodes) + " nodes in " + str(round(execution_time, 3)) + "s (" +
+          str(int(nodes / execution_time) if execution_time > 0 else 0) + " nodes/s)")
+    return nodes
+
+
+"""
+Checks every reference position up to max_depth. Returns True if all counts matched
+"""
+
+
+def run_suite(max_depth, check=False):
+    all_passed = True
+    total_nodes = 0
+    begin_time = time.perf_counter()
+    for name, (fen, expected_counts) in REFERENCE_POSITIONS.items():
+        gs = engine.GameState()
+        gs.load_fen(fen)
+        for depth, expected in enumerate(expected_counts[:max_depth], 1):
+            nodes = perft(gs, depth, check)
+            total_nodes += nodes
+            passed = nodes == expected
+            all_passed = all_passed and passed
+            print(("ok  " if passed else "FAIL") + " " + name + " depth " + str(depth) + ": " + str(nodes) +
+                  ("" if passed else " (expected " + str(expected) + ")"))
+    execution_time = time.perf_counter() - begin_time
+    print(str(total_nodes) + " nodes in " + str(round(execution_time, 3)) + "s (" +
+          str(int(total_nodes / execution_time)) + " nodes/s)")
+    return all_passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Count leaf nodes of the move generator's game tree")
+    parser.add_argument("--fen", default=START_FEN, help="position to search from (default: start position)")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--divide", action="store_true", help="break the count down by root move")
+    parser.add_argument("--check", action="store_true",
+                        help="verify the hash, scores and that undo_move restores the position after every move")
+    parser.add_argument("--suite", action="store_true", help="compare against the reference positions")
+    parser.add_argument("--profile", choices=profiling.PROFILE_MODES, default=None,
+                        help="profile the move generator while counting (see profiling.py)")
+    args = parser.parse_args()
+    if args.profile is not None:
+        profiling.enable(args.profile)
+    if args.suite:
+        raise SystemExit(0 if profiling.profile_call("run_suite", run_suite, args.depth, args.check) else 1)
+    profiling.profile_call("perft", run, args.fen, args.depth, args.divide, args.check)
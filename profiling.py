@@ -0,0 +1,177 @@
+"""
+Opt-in profiling for the engine, off unless asked for, so the search runs at full speed normally.
+Switched on with the CHESS_PROFILE environment variable (inherited by the search worker and the parallel helpers, so
+it also reaches searches that run in another process) or the --profile flag of perft.py and parallel_search.py:
+    CHESS_PROFILE=timers    wraps the engine's hot functions (TIMED_FUNCTIONS) in timers that keep the stack of
+                            timed calls. Writes <prefix>-<pid>.folded, collapsed stacks with the self time of every
+                            stack in microseconds (flamegraph.pl or speedscope read them), and <prefix>-<pid>.txt,
+                            a table of calls, total and self time per function
+    CHESS_PROFILE=cprofile  runs every search under cProfile. Writes <prefix>-<pid>.prof (for pstats, snakeviz or
+                            gprof2dot) and <prefix>-<pid>.txt, the functions with the most time of their own
+The prefix is CHESS_PROFILE_OUT, "profile" in the working directory by default. The files are rewritten after every
+profiled call (find_best_move, search_root_moves or the perft run) with the totals so far.
+
+usage: CHESS_PROFILE=timers python main.py
+       python perft.py --depth 4 --profile timers
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import time
+import engine
+import smart_move_finder
+
+PROFILE_MODES = ("timers", "cprofile")
+SUMMARY_ROWS = 30  # functions listed in a cProfile summary
+
+# (class or module, function name) pairs the timers wrap
+TIMED_FUNCTIONS = [(engine.GameState, "get_valid_moves"), (engine.GameState, "legal_move"),
+                   (engine.GameState, "get_pins_and_checks"), (engine.GameState, "get_all_possible_moves"),
+                   (engine.GameState, "get_castle_moves"), (engine.GameState, "square_under_attack"),
+                   (engine.GameState, "make_move"), (engine.GameState, "undo_move"),
+                   (engine.GameState, "make_null_move"),
+                   (smart_move_finder, "find_move_nega_max_alpha_beta"), (smart_move_finder, "quiescence_search"),
+                   (smart_move_finder, "score_board"), (smart_move_finder, "find_principal_variation")]
+# the calls a report is written after
+PROFILED_CALLS = [(smart_move_finder, "find_best_move"), (smart_move_finder, "search_root_moves")]
+
+mode = os.environ.get("CHESS_PROFILE", "").lower() or None
+installed = False
+profiler = None  # the cProfile.Profile in cprofile mode
+profiled_depth = 0  # profiled calls in progress, a profiled call made inside another one is part of the outer report
+
+# timers state
+stack = []  # [name, path, start time, time spent in timed calls below] for every timed call in progress
+active = {}  # name -> how many calls of it are in progress, so recursive calls only count once in the total
+self_times = {}  # collapsed stack path -> seconds spent in its last function and not in a timed call below it
+totals = {}  # name -> [calls, total seconds, self seconds]
+
+
+"""
+Switches profiling on from a command line flag. Also sets the environment variable so processes started from here on
+profile themselves too
+"""
+
+
+def enable(profile_mode):
+    global mode
+    if profile_mode not in PROFILE_MODES:
+        raise ValueError("profile mode must be one of " + ", ".join(PROFILE_MODES))
+    mode = profile_mode
+    os.environ["CHESS_PROFILE"] = profile_mode
+    install()
+
+
+"""
+Puts the hooks in place if profiling is on, does nothing otherwise. Every process that searches calls it once at the
+start, calling it again is harmless
+"""
+
+
+def install():
+    global installed, profiler
+    if mode is None or installed:
+        return
+    if mode not in PROFILE_MODES:
+        print("Unknown CHESS_PROFILE mode:", mode, "- profiling is off")
+        return
+    installed = True
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+    else:
+        for owner, name in TIMED_FUNCTIONS:
+            setattr(owner, name, timed(name, getattr(owner, name)))
+    for owner, name in PROFILED_CALLS:
+        function = getattr(owner, name)
+        setattr(owner, name, lambda *args, _function=function, _name=name, **kwargs:
+                profile_call(_name, _function, *args, **kwargs))
+
+
+def timed(name, function):
+    def wrapper(*args, **kwargs):
+        # consecutive calls of the same function (recursion) share one frame so the stacks stay readable
+        path = stack[-1][1] if stack and stack[-1][0] == name else (stack[-1][1] + ";" + name if stack else name)
+        frame = [name, path, time.perf_counter(), 0.0]
+        stack.append(frame)
+        active[name] = active.get(name, 0) + 1
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - frame[2]
+            stack.pop()
+            active[name] -= 1
+            own = elapsed - frame[3]
+            self_times[path] = self_times.get(path, 0.0) + own
+            counts = totals.setdefault(name, [0, 0.0, 0.0])
+            counts[0] += 1
+            counts[2] += own
+            if active[name] == 0:
+                counts[1] += elapsed
+            if stack:
+                stack[-1][3] += elapsed
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+
+"""
+Calls function(*args) under the profiler when profiling is on and writes the report afterwards.
+The call is the root frame of the collapsed stacks in timers mode
+"""
+
+
+def profile_call(name, function, *args, **kwargs):
+    global profiled_depth
+    install()
+    if not installed:
+        return function(*args, **kwargs)
+    if profiled_depth > 0:
+        return timed(name, function)(*args, **kwargs) if mode == "timers" else function(*args, **kwargs)
+    profiled_depth += 1
+    if mode == "cprofile":
+        profiler.enable()
+    try:
+        return timed(name, function)(*args, **kwargs) if mode == "timers" else function(*args, **kwargs)
+    finally:
+        if mode == "cprofile":
+            profiler.disable()
+        profiled_depth -= 1
+        write_report()
+
+
+def output_prefix():
+    return os.environ.get("CHESS_PROFILE_OUT", "profile") + "-" + str(os.getpid())
+
+
+def write_report():
+    prefix = output_prefix()
+    if mode == "cprofile":
+        profiler.dump_stats(prefix + ".prof")
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("tottime").print_stats(SUMMARY_ROWS)
+        table = text.getvalue()
+    else:
+        with open(prefix + ".folded", "w") as file:
+            for path, seconds in sorted(self_times.items()):
+                if seconds >= 0.000001:
+                    file.write(path + " " + str(int(seconds * 1000000)) + "\n")
+        table = summary_table()
+    with open(prefix + ".txt", "w") as file:
+        file.write(table)
+    print("Profile written to", prefix + (".prof" if mode == "cprofile" else ".folded"), "and", prefix + ".txt")
+
+
+"""
+One row per timed function, most self time first. The root call's total is what the percentages are of
+"""
+
+
+def summary_table():
+    profiled_time = max((counts[1] for counts in totals.values()), default=0.0) or 1.0
+    rows = ["%-32s %10s %10s %10s %7s %10s" % ("function", "calls", "total s", "self s", "self %", "us/call")]
+    for name, (calls, total, own) in sorted(totals.items(), key=lambda item: -item[1][2]):
+        rows.append("%-32s %10d %10.3f %10.3f %6.1f%% %10.2f" % (name, calls, total, own, 100 * own / profiled_time,
+                                                                 1000000 * total / calls if calls else 0.0))
+    return "\n".join(rows) + "\n"
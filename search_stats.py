@@ -0,0 +1,114 @@
+"""
+Statistics of one search, kept by smart_move_finder while it searches (smart_move_finder.stats) instead of loose
+global counters. Besides the printed summary they can be appended to a file as JSON lines, one object per search, so
+the numbers of different versions or settings can be compared by a script
+"""
+
+import json
+import time
+
+
+class SearchStats:
+    def __init__(self, position_key=None):
+        self.position_key = position_key  # zobrist key of the root position
+        self.nodes = 0  # alpha beta nodes
+        self.quiescence_nodes = 0
+        self.beta_cutoffs = 0
+        self.first_move_cutoffs = 0  # cutoffs by the first move tried, the more of them the better the move ordering
+        self.null_move_cutoffs = 0
+        self.lmr_researches = 0  # reduced searches that beat alpha and had to be searched again at full depth
+        self.pvs_researches = 0  # null window searches that landed inside the window and had to be searched again
+        self.aspiration_researches = 0  # root searches that fell outside the aspiration window
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_stores = 0
+        self.tt_overwrites = 0  # stores that pushed out an entry for a different position, a sign the table is too small
+        self.iterations = []  # one dict per completed depth, see end_iteration
+        self.best_move = None  # the move played in long algebraic notation
+        self.book_move = False
+        self.seconds = 0.0
+        self.start_time = time.perf_counter()
+
+    """
+    Records a completed iteration: its nodes and time are what was used since the previous one ended,
+    pv is the list of moves in long algebraic notation
+    """
+    def end_iteration(self, depth, score, pv):
+        nodes = self.nodes + self.quiescence_nodes
+        seconds = time.perf_counter() - self.start_time
+        previous = self.iterations[-1] if self.iterations else {"total_nodes": 0, "total_seconds": 0.0}
+        self.iterations.append({"depth": depth, "score": score, "pv": pv,
+                                "nodes": nodes - previous["total_nodes"], "total_nodes": nodes,
+                                "seconds": seconds - previous["total_seconds"], "total_seconds": seconds})
+
+    """
+    Called once the move is chosen. The transposition table is left out for a book move, it wasn't searched
+    """
+    def finish(self, best_move, transposition_table=None, book_move=False):
+        self.seconds = time.perf_counter() - self.start_time
+        self.best_move = best_move.get_long_algebraic() if best_move is not None else None
+        self.book_move = book_move
+        if transposition_table is not None:
+            self.tt_probes = transposition_table.probes
+            self.tt_hits = transposition_table.hits
+            self.tt_stores = transposition_table.stores
+            self.tt_overwrites = transposition_table.overwrites
+
+    def total_nodes(self):
+        return self.nodes + self.quiescence_nodes
+
+    def nodes_per_second(self):
+        seconds = self.seconds or time.perf_counter() - self.start_time
+        return self.total_nodes() / seconds if seconds > 0 else 0.0
+
+    """
+    How many times more nodes the last iteration took than the one before, or None before two iterations are done
+    """
+    def effective_branching_factor(self):
+        if len(self.iterations) < 2 or self.iterations[-2]["nodes"] == 0:
+            return None
+        return self.iterations[-1]["nodes"] / self.iterations[-2]["nodes"]
+
+    def first_move_cutoff_rate(self):
+        return self.first_move_cutoffs / self.beta_cutoffs if self.beta_cutoffs else 0.0
+
+    def tt_hit_rate(self):
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    def tt_overwrite_rate(self):
+        return self.tt_overwrites / self.tt_stores if self.tt_stores else 0.0
+
+    def principal_variation(self):
+        return self.iterations[-1]["pv"] if self.iterations else []
+
+    def to_dict(self):
+        return {"time": time.time(), "position_key": self.position_key, "best_move": self.best_move,
+                "book_move": self.book_move, "depth": self.iterations[-1]["depth"] if self.iterations else 0,
+                "nodes": self.nodes, "quiescence_nodes": self.quiescence_nodes, "seconds": self.seconds,
+                "nodes_per_second": self.nodes_per_second(),
+                "effective_branching_factor": self.effective_branching_factor(),
+                "beta_cutoffs": self.beta_cutoffs, "first_move_cutoff_rate": self.first_move_cutoff_rate(),
+                "null_move_cutoffs": self.null_move_cutoffs, "lmr_researches": self.lmr_researches,
+                "pvs_researches": self.pvs_researches, "aspiration_researches": self.aspiration_researches,
+                "tt_probes": self.tt_probes, "tt_hit_rate": self.tt_hit_rate(),
+                "tt_stores": self.tt_stores, "tt_overwrites": self.tt_overwrites,
+                "pv": self.principal_variation(), "iterations": self.iterations}
+
+    def write_json_line(self, path):
+        with open(path, "a") as file:
+            file.write(json.dumps(self.to_dict()) + "\n")
+
+    def summary(self):
+        branching = self.effective_branching_factor()
+        return "\n".join([
+            "Nodes: " + str(self.nodes) + " + " + str(self.quiescence_nodes) + " quiescence in " +
+            str(round(self.seconds, 3)) + " s (" + str(int(self.nodes_per_second())) + " nodes/s)",
+            "Nodes per depth: " + ", ".join(str(iteration["depth"]) + ": " + str(iteration["nodes"])
+                                             for iteration in self.iterations),
+            "Effective branching factor: " + (str(round(branching, 2)) if branching is not None else "-") +
+            "  first move cutoffs: " + str(round(100 * self.first_move_cutoff_rate(), 1)) + "%" +
+            "  TT hit rate: " + str(round(100 * self.tt_hit_rate(), 1)) + "%" +
+            "  stores: " + str(self.tt_stores) + " (" + str(round(100 * self.tt_overwrite_rate(), 1)) + "% overwrites)",
+            "Null move cutoffs: " + str(self.null_move_cutoffs) + "  re-searches LMR: " + str(self.lmr_researches) +
+            "  PVS: " + str(self.pvs_researches) + "  aspiration: " + str(self.aspiration_researches),
+            "PV: " + " ".join(self.principal_variation())])
@@ -0,0 +1,238 @@
+"""
+Long lived AI process. The worker keeps its own GameState and search tables between moves, so instead of pickling the
+whole game for every search it is only sent the moves played since the last request.
+Moves travel between the processes as their move_ID (see engine.Move), lists of them as array("H") at two bytes a move.
+After its move the AI can ponder: search the position after the reply it expects while the human thinks. If the human
+plays that reply the running search just gets a clock and carries on, otherwise it is cancelled.
+"""
+
+from array import array
+from multiprocessing import Process, Queue, Value, parent_process
+import queue
+import time
+import engine
+import profiling
+import smart_move_finder
+
+
+"""
+Waits for the next request, giving up with a "quit" if the process that started this one has gone away
+"""
+
+
+def next_request(request_queue):
+    while True:
+        try:
+            return request_queue.get(timeout=1)
+        except queue.Empty:
+            if not parent_process().is_alive():
+                return ("quit",)
+
+
+"""
+Runs in the worker process until a "quit" request arrives.
+Requests:
+    ("reset", fen) - start over from a new position, fen None for the standard start
+    ("search", search_id, undo_count, new_moves, time_remaining, increment, ponder) - take back undo_count moves, play
+        new_moves, search and put (search_id, move_ID or None, expected reply move_ID or None) on the result queue
+    ("quit",)
+A search stops early once current_search_id no longer matches its id, which is how the GUI cancels it.
+A ponder search has no clock until ponder_hit_id is set to its id, from then on it has its share of hit_time_remaining.
+With worker_count above 1 the searches are split between that many helper processes (see parallel_search), which
+don't ponder
+"""
+
+
+def worker_loop(request_queue, result_queue, current_search_id, ponder_hit_id, hit_time_remaining, worker_count=1):
+    profiling.install()
+    gs = engine.GameState()
+    start_fen = None
+    parallel = None
+    if worker_count > 1:
+        from parallel_search import ParallelSearch  # imported here, parallel_search imports this module
+        parallel = ParallelSearch(worker_count)
+    while True:
+        request = next_request(request_queue)
+        if request[0] == "quit":
+            if parallel is not None:
+                parallel.stop()
+            break
+        elif request[0] == "reset":
+            gs = engine.GameState()
+            start_fen = request[1]
+            if start_fen is not None:
+                gs.load_fen(start_fen)
+        elif request[0] == "search":
+            search_id, undo_count, new_moves, time_remaining, increment, ponder = request[1:]
+            for _ in range(undo_count):
+                gs.undo_move()
+            for move in new_moves:
+                gs.make_move(find_move(gs.get_valid_moves(), move))
+            if current_search_id.value != search_id:  # cancelled while waiting in the queue
+                result_queue.put((search_id, None, None))
+                continue
+            should_stop = lambda: current_search_id.value != search_id
+            expected_reply = None
+            if parallel is not None:
+                best_move = parallel.find_best_move(gs, gs.get_valid_moves(), time_remaining, increment, start_fen,
+                                                    should_stop)
+            else:
+                if ponder:
+                    best_move = ponder_search(gs, search_id, current_search_id, ponder_hit_id, hit_time_remaining,
+                                              increment)
+                else:
+                    smart_move_finder.should_stop = should_stop
+                    best_move = smart_move_finder.find_best_move(gs, gs.get_valid_moves(), None, time_remaining,
+                                                                 increment)
+                smart_move_finder.should_stop = None
+                if best_move is not None:
+                    expected_reply = smart_move_finder.find_expected_reply(gs, best_move)
+            result_queue.put((search_id, best_move.move_ID if best_move is not None else None,
+                              expected_reply.move_ID if expected_reply is not None else None))
+
+
+"""
+Searches without a clock until the GUI reports a ponder hit, then starts the clock inside the running search.
+If the search ends before the hit (e.g. it found a mate) the move is held back until the hit, so the AI doesn't answer
+a move that hasn't been played. Returns None if the ponder search was cancelled
+"""
+
+
+def ponder_search(gs, search_id, current_search_id, ponder_hit_id, hit_time_remaining, increment):
+    hit = False
+
+    def should_stop():
+        nonlocal hit
+        if current_search_id.value != search_id:
+            return True
+        if not hit and ponder_hit_id.value == search_id:
+            hit = True
+            smart_move_finder.start_clock(smart_move_finder.get_time_budget(hit_time_remaining.value, increment))
+        return False
+
+    smart_move_finder.should_stop = should_stop
+    best_move = smart_move_finder.find_best_move(gs, gs.get_valid_moves(), ponder=True)
+    while not hit:
+        if should_stop():
+            return None
+        time.sleep(0.01)
+    return best_move
+
+
+def move_ids(moves):
+    return array("H", [move.move_ID for move in moves])
+
+
+"""
+Finds the Move in valid_moves with the move_ID
+"""
+
+
+def find_move(valid_moves, move_id):
+    for move in valid_moves:
+        if move.move_ID == move_id:
+            return move
+    raise ValueError("move " + str(move_id) + " is not legal in the worker's position")
+
+
+class SearchWorker:
+    """
+    The GUI side of the worker. Remembers which moves the worker has already been sent so each search request only
+    carries the difference. worker_count above 1 spreads each search over that many processes
+    """
+    def __init__(self, worker_count=1):
+        self.request_queue = Queue()
+        self.result_queue = Queue()
+        self.current_search_id = Value("i", 0, lock=False)
+        self.ponder_hit_id = Value("i", 0, lock=False)  # id of the ponder search whose expected reply was played
+        self.hit_time_remaining = Value("d", 0.0, lock=False)  # the AI's clock at the ponder hit
+        self.synced_moves = array("H")  # move_IDs of the moves the worker's GameState has played
+        self.expected_reply = None  # move_ID of the move the last search expects the opponent to answer with
+        self.pondering = False
+        # a daemon process can't start the parallel search's helpers, without one the worker watches for the GUI exiting
+        self.process = Process(target=worker_loop, daemon=worker_count == 1,
+                               args=(self.request_queue, self.result_queue, self.current_search_id, self.ponder_hit_id,
+                                     self.hit_time_remaining, worker_count))
+        self.process.start()
+
+    """
+    Starts a search of the position reached by move_log (played from the standard start position)
+    """
+    def start_search(self, move_log, time_remaining=None, increment=0):
+        self.send_search(move_ids(move_log), time_remaining, increment, False)
+
+    """
+    Starts pondering on the reply the last search expected to its move, which has to be the last move of move_log.
+    Returns False if there is nothing to ponder on
+    """
+    def start_ponder(self, move_log, increment=0):
+        if self.expected_reply is None:
+            return False
+        self.send_search(move_ids(move_log) + array("H", [self.expected_reply]), None, increment, True)
+        self.pondering = True
+        return True
+
+    """
+    Called when the AI has to move in the position reached by move_log. If the worker is pondering on exactly that
+    position its search carries on with time_remaining on the AI's clock and True is returned, otherwise the ponder
+    search is cancelled (its table entries are kept) and the caller should start a new search
+    """
+    def ponder_hit(self, move_log, time_remaining):
+        if not self.pondering:
+            return False
+        self.pondering = False
+        if move_ids(move_log) != self.synced_moves:
+            self.cancel()
+            return False
+        self.hit_time_remaining.value = time_remaining
+        self.ponder_hit_id.value = self.current_search_id.value
+        return True
+
+    def send_search(self, moves, time_remaining, increment, ponder):
+        common = 0  # length of the history the worker already agrees with
+        while common < len(moves) and common < len(self.synced_moves) and moves[common] == self.synced_moves[common]:
+            common += 1
+        undo_count = len(self.synced_moves) - common
+        self.synced_moves = moves
+        self.current_search_id.value += 1
+        self.request_queue.put(("search", self.current_search_id.value, undo_count, moves[common:], time_remaining,
+                                increment, ponder))
+
+    """
+    Stops the current search, its result will be ignored. The worker keeps its position and tables
+    """
+    def cancel(self):
+        self.current_search_id.value += 1
+        self.pondering = False
+
+    """
+    Returns the Move from valid_moves the worker picked, or None while it is still thinking.
+    Results from cancelled searches are thrown away
+    """
+    def get_result(self, valid_moves):
+        while True:
+            try:
+                search_id, move, expected_reply = self.result_queue.get_nowait()
+            except queue.Empty:
+                return None
+            if search_id == self.current_search_id.value:
+                self.expected_reply = expected_reply
+                if move is None:  # the search had no move to return, let the caller fall back to a random move
+                    return smart_move_finder.find_random_move(valid_moves)
+                return find_move(valid_moves, move)
+
+    """
+    Starts the worker over from a new position, e.g. when the game is restarted
+    """
+    def reset(self, fen=None):
+        self.cancel()
+        self.synced_moves = array("H")
+        self.expected_reply = None
+        self.request_queue.put(("reset", fen))
+
+    def stop(self):
+        self.cancel()
+        self.request_queue.put(("quit",))
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
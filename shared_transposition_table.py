@@ -0,0 +1,163 @@
+"""
+Transposition table kept in a multiprocessing.shared_memory block so every search process reads and writes the same
+entries. The parallel search helpers use it to share work: a position one helper has searched is a hit for the others.
+Works like TranspositionTable (same bucket scheme, same probe/store interface and entry layout) but every slot is two
+64 bit words, so nothing is pickled or locked:
+    word 0: key ^ data
+    word 1: data - score, depth, bound, best move and age packed together (see pack_entry)
+Two processes writing the same slot at once can leave word 0 from one and word 1 from the other. The xor makes such a
+torn slot fail the key check on probe, so it just reads as a miss (the "lockless hashing" trick)
+"""
+
+from multiprocessing import shared_memory
+from transposition_table import KEY, DEPTH, AGE
+
+SLOT_SIZE = 16  # bytes
+SCORE_SCALE = 1000  # scores are stored as whole thousandths of a pawn
+SCORE_OFFSET = 1 << 31
+MOVE_FLAG = 1 << 12  # set when the entry has a best move, the low 12 bits are its move_ID
+MASK_64 = (1 << 64) - 1
+
+# bit positions inside the data word
+DEPTH_SHIFT = 32
+BOUND_SHIFT = 40
+MOVE_SHIFT = 42
+AGE_SHIFT = 55
+
+
+"""
+Packs an entry into one 64 bit word. best_move is a move_ID (see engine.Move) or None
+"""
+
+
+def pack_entry(depth, score, bound, best_move, age):
+    move = MOVE_FLAG | best_move if best_move is not None else 0
+    return ((int(round(score * SCORE_SCALE)) + SCORE_OFFSET) | min(depth, 255) << DEPTH_SHIFT | bound << BOUND_SHIFT
+            | move << MOVE_SHIFT | (age & 255) << AGE_SHIFT)
+
+
+"""
+Returns the entry tuple, laid out like the entries of TranspositionTable
+"""
+
+
+def unpack_entry(key, data):
+    move = data >> MOVE_SHIFT & 0x1FFF
+    best_move = move & 0xFFF if move & MOVE_FLAG else None
+    return (key, data >> DEPTH_SHIFT & 255, ((data & 0xFFFFFFFF) - SCORE_OFFSET) / SCORE_SCALE,
+            data >> BOUND_SHIFT & 3, best_move, data >> AGE_SHIFT & 255)
+
+
+class SharedTranspositionTable:
+    """
+    Create it in the parent before starting the search processes and hand it to them, or attach to an existing
+    block by name (with the same size_mb). Word 0 of the block holds the search age, so all processes agree which
+    entries are old. The hit and store counters are per process
+    """
+    def __init__(self, size_mb=16, name=None):
+        self.bucket_count = max(1, size_mb * 1024 * 1024 // (2 * SLOT_SIZE))
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=8 + 2 * self.bucket_count * SLOT_SIZE)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.words = self.memory.buf.cast("Q")  # a new block starts zeroed, which reads as empty everywhere
+        self.age = self.words[0] & 255
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    """
+    Processes started with spawn get the table pickled, which only sends the name of the block
+    """
+    def __getstate__(self):
+        return self.memory.name, self.bucket_count
+
+    def __setstate__(self, state):
+        name, self.bucket_count = state
+        self.memory = shared_memory.SharedMemory(name=name)
+        self.words = self.memory.buf.cast("Q")
+        self.age = self.words[0] & 255
+        self.probes = self.hits = self.stores = self.overwrites = 0
+
+    """
+    Returns the entry for this slot if it belongs to key, None if it is empty, another position or torn
+    """
+    def read_slot(self, slot, key):
+        data = self.words[slot + 1]
+        if data == 0 or self.words[slot] ^ data != key:
+            return None
+        return unpack_entry(key, data)
+
+    def slot_key(self, slot):
+        data = self.words[slot + 1]
+        return self.words[slot] ^ data if data != 0 else None
+
+    def write_slot(self, slot, key, data):
+        self.words[slot] = key ^ data
+        self.words[slot + 1] = data
+
+    def probe(self, key):
+        self.probes += 1
+        key &= MASK_64
+        slot = 1 + (key % self.bucket_count) * 4
+        entry = self.read_slot(slot, key)
+        if entry is None:
+            entry = self.read_slot(slot + 2, key)
+        if entry is not None:
+            self.hits += 1
+        return entry
+
+    def store(self, key, depth, score, bound, best_move):
+        self.stores += 1
+        key &= MASK_64
+        slot = 1 + (key % self.bucket_count) * 4
+        data = pack_entry(depth, score, bound, best_move.move_ID if best_move is not None else None, self.age)
+        deepest_key = self.slot_key(slot)
+        deepest = self.read_slot(slot, deepest_key) if deepest_key is not None else None
+        if deepest is None or deepest[KEY] == key or depth >= deepest[DEPTH] or deepest[AGE] != self.age:
+            if deepest is not None and deepest[KEY] != key:
+                # the old deep entry is still worth more than whatever was in the always-replace slot
+                replaced_key = self.slot_key(slot + 2)
+                if replaced_key is not None and replaced_key != key:
+                    self.overwrites += 1
+                self.write_slot(slot + 2, deepest[KEY], self.words[slot + 1])
+            elif self.slot_key(slot + 2) == key:
+                self.write_slot(slot + 2, 0, 0)  # don't keep a stale copy of the same position
+            self.write_slot(slot, key, data)
+        else:
+            replaced_key = self.slot_key(slot + 2)
+            if replaced_key is not None and replaced_key != key:
+                self.overwrites += 1
+            self.write_slot(slot + 2, key, data)
+
+    """
+    Called by every process at the start of its search, picks up the shared age
+    """
+    def new_search(self):
+        self.age = self.words[0] & 255
+        self.probes = self.hits = self.stores = self.overwrites = 0
+
+    """
+    Called once by whoever coordinates the search when a new position is searched,
+    so the entries of earlier searches can be replaced freely
+    """
+    def advance_age(self):
+        self.words[0] = (self.words[0] + 1) & 255
+        self.age = self.words[0]
+
+    def clear(self):
+        self.memory.buf[8:] = bytes(len(self.memory.buf) - 8)
+        self.probes = self.hits = self.stores = self.overwrites = 0
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    """
+    Every process closes its view when done, the creator also unlinks the block
+    """
+    def close(self, unlink=False):
+        self.words.release()
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
@@ -1,10 +1,63 @@
 import random
-import datetime
-
-piece_values = {"Q": 10, "R": 5, "B": 3, "N": 3, "P": 1, "K": 0}
+import os
+import time
+import bitbase
+from bitboard import pop_count
+from evaluation import PIECE_VALUES, POSITIONAL_WEIGHT
+from transposition_table import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND, DEPTH as TT_DEPTH, SCORE, BOUND, \
+    BEST_MOVE
+from move_ordering import MoveOrderer
+from opening_book import OpeningBook
+from search_stats import SearchStats
+
+piece_values = PIECE_VALUES
 CHECKMATE = 1000
 STALEMATE = 0
-DEPTH = 3
+DEPTH = 3  # search depth when there is no clock to manage
+MAX_DEPTH = 32  # iterative deepening stops here even if there is time left
+MOVES_TO_GO = 30  # the remaining clock is split as if the game will last this many more moves
+TIME_SAFETY_MARGIN = 0.25  # seconds held back for process start up and returning the move
+CHECK_TIME_EVERY = 512  # nodes searched between clock checks
+QUIESCENCE = True  # keep searching captures past the depth limit instead of scoring the middle of an exchange
+NULL_MOVE_PRUNING = True  # cut off when passing the turn still fails high (see find_move_nega_max_alpha_beta)
+NULL_MOVE_REDUCTION = 2  # how much shallower the search after passing is
+NULL_MOVE_MIN_DEPTH = 3
+LATE_MOVE_REDUCTIONS = True  # search quiet moves ordered late one or two plies shallower first
+LMR_FULL_MOVES = 3  # moves searched to full depth before reductions start
+LMR_MIN_DEPTH = 3
+PRINCIPAL_VARIATION_SEARCH = True  # moves after the first only get a null window unless they beat alpha
+ASPIRATION_WINDOWS = True  # start each iteration with a narrow window around the last iteration's score
+ASPIRATION_WINDOW = 0.5  # pawns either side of it, four times wider after every fail
+MIN_SCORE_STEP = 0.001  # scores never differ by less, so a window this wide is a null window
+TT_SIZE_MB = 16  # memory cap for the transposition table
+USE_BOOK = True  # play moves from the opening book while the position is in it
+BITBASES = True  # score positions with two kings and a pawn, rook or queen from the bitbases (see bitbase.py)
+BITBASE_PIECES = 3  # most pieces, kings included, in a position the bitbases cover
+STATS_FILE = None  # file every search's statistics are appended to as a line of JSON, None for none
+BOOK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")  # any Polyglot book, optional
+
+transposition_table = TranspositionTable(TT_SIZE_MB)
+move_orderer = MoveOrderer()
+opening_book = None  # opened on first use
+root_depth = DEPTH  # depth of the current iteration
+clock_start = None  # time.perf_counter() value when the AI's clock started for this search
+time_budget = None  # seconds the search may use from clock_start, None for no limit
+deadline = None  # time.perf_counter() value the search has to stop by, None for no limit
+should_stop = None  # optional function set by whoever runs the search in the background, True once the result isn't wanted
+report_iteration = None  # optional function(stats) called after every completed iteration
+split_root = False  # True while searching only some of the root moves, see search_root_moves
+split_root_best = None  # move_ID of the best of those root moves in the previous iteration
+root_in_bitbase = False  # the root position is already covered by the bitbases
+stats = SearchStats()  # statistics of the current or last search
+
+
+"""
+Raised inside the search when the clock runs out or the search is stopped from outside
+"""
+
+
+class SearchTimeout(Exception):
+    pass
 
 
 """
@@ -18,21 +71,257 @@ def find_random_move(valid_moves):
 
 """
 Helper method to make the first recursive call of minmax
+Plays a book move right away if there is one. Otherwise searches to a fixed DEPTH, or if the AI's clock is given,
+deepens one ply at a time until its share of the clock is used. move_time fixes that share in seconds instead, and
+max_depth replaces DEPTH or MAX_DEPTH as the deepest iteration.
+With ponder the search keeps deepening without a clock until it is stopped or start_clock is called from should_stop.
+The move is returned and also put on return_queue if one is given
 """
 
 
-def find_best_move(gs, valid_moves, return_queue):
-    global next_move, counter
+def find_best_move(gs, valid_moves, return_queue=None, time_remaining=None, increment=0, ponder=False, move_time=None,
+                   max_depth=None):
+    global next_move, stats
     next_move = None
     random.shuffle(valid_moves)  # to allow for variation in games with AI
-    counter = 0
-    begin_time = datetime.datetime.now()
-    find_move_nega_max_alpha_beta(gs, valid_moves, DEPTH, -CHECKMATE, CHECKMATE, 1 if gs.white_to_move else -1)
-    execution_time = datetime.datetime.now() - begin_time
+    stats = SearchStats(gs.zobrist_key)
+    book_move = find_book_move(gs, valid_moves)
+    if book_move is not None:
+        print("Book move:", book_move)
+        stats.finish(book_move, book_move=True)
+        if STATS_FILE is not None:
+            stats.write_json_line(STATS_FILE)
+        if return_queue is not None:
+            return_queue.put(book_move)
+        return book_move
+    transposition_table.new_search()
+    move_orderer.new_search()
+    if ponder:
+        next_move = find_move_iterative_deepening(gs, valid_moves, None, max_depth or MAX_DEPTH)
+    elif move_time is not None:
+        next_move = find_move_iterative_deepening(gs, valid_moves, move_time, max_depth or MAX_DEPTH)
+    elif time_remaining is None:
+        next_move = find_move_iterative_deepening(gs, valid_moves, None, max_depth or DEPTH)
+    else:
+        next_move = find_move_iterative_deepening(gs, valid_moves, get_time_budget(time_remaining, increment),
+                                                  max_depth or MAX_DEPTH)
+    stats.finish(next_move, transposition_table)
     print()
-    print("# of moves evaluated: ",  counter)
-    print("Time elapsed: ", execution_time)
-    return_queue.put(next_move)
+    print(stats.summary())
+    if STATS_FILE is not None:
+        stats.write_json_line(STATS_FILE)
+    if return_queue is not None:
+        return_queue.put(next_move)
+    return next_move
+
+
+"""
+Returns a weighted random move from the opening book for the position, or None if it isn't in the book or there is no
+book file
+"""
+
+
+def find_book_move(gs, valid_moves):
+    global opening_book
+    if not USE_BOOK or not os.path.exists(BOOK_FILE):
+        return None
+    if opening_book is None:
+        opening_book = OpeningBook(BOOK_FILE)
+    return opening_book.choose_move(gs, valid_moves)
+
+
+"""
+How many seconds to spend on this move given the time left on the AI's clock and the increment it gets back
+"""
+
+
+def get_time_budget(time_remaining, increment):
+    budget = time_remaining / MOVES_TO_GO + increment * 0.75
+    # never plan to use more than half of what is left, the increment only arrives after the move is made
+    return max(0.05, min(budget, (time_remaining - TIME_SAFETY_MARGIN) / 2))
+
+
+"""
+Starts the AI's clock: the search has budget seconds (None for no limit) from now.
+Can be called while a search is running, which is how a ponder search turns into a normal one
+"""
+
+
+def start_clock(budget):
+    global clock_start, time_budget, deadline
+    clock_start = time.perf_counter()
+    time_budget = budget
+    deadline = clock_start + budget if budget is not None else None
+
+
+"""
+Searches depth 1, 2, 3... until the time budget (in seconds, None for no limit) runs out or max_depth is reached,
+and returns the best move of the last completed iteration.
+Depth 1 is always finished unless the search is stopped, so there is a move to play even with almost no time left
+"""
+
+
+def find_move_iterative_deepening(gs, valid_moves, budget, max_depth=MAX_DEPTH):
+    global next_move, root_depth, deadline, time_budget
+    start_time = time.perf_counter()
+    start_clock(budget)
+    move_log_length = len(gs.move_log)
+    turn_multiplier = 1 if gs.white_to_move else -1
+    best_move = None
+    score = None
+    for depth in range(1, max_depth + 1):
+        root_depth = depth
+        try:
+            score = aspiration_search(gs, valid_moves, depth, score, turn_multiplier)
+        except SearchTimeout:
+            # the search stopped in the middle of the tree, take back the moves it had made
+            while len(gs.move_log) > move_log_length:
+                gs.undo_move()
+            break
+        best_move = next_move
+        elapsed = time.perf_counter() - start_time
+        print("depth", depth, "best move:", best_move, "score:", score, "time:", round(elapsed, 2))
+        stats.end_iteration(depth, score, [move.get_long_algebraic()
+                                           for move in find_principal_variation(gs, best_move, depth)])
+        if report_iteration is not None:
+            report_iteration(stats)
+        if abs(score) >= CHECKMATE:  # found a forced mate, searching deeper won't change anything
+            break
+        if time_budget is not None and time.perf_counter() - clock_start > time_budget / 2:
+            # the next iteration takes several times longer and wouldn't finish
+            break
+    deadline = time_budget = None
+    return best_move
+
+
+"""
+Searches the root with a window of ASPIRATION_WINDOW either side of guess, the score of the previous iteration, which
+is usually close. A narrow window cuts off far more. When the score falls outside it the root is searched again with
+the failing side of the window four times further out, until the score lands inside or the window is the whole range
+"""
+
+
+def aspiration_search(gs, valid_moves, depth, guess, turn_multiplier):
+    global next_move
+    if not ASPIRATION_WINDOWS or guess is None or abs(guess) >= CHECKMATE:
+        next_move = None
+        return find_move_nega_max_alpha_beta(gs, valid_moves, depth, -CHECKMATE, CHECKMATE, turn_multiplier)
+    delta = ASPIRATION_WINDOW
+    alpha, beta = guess - delta, guess + delta
+    while True:
+        alpha, beta = max(alpha, -CHECKMATE), min(beta, CHECKMATE)
+        next_move = None
+        score = find_move_nega_max_alpha_beta(gs, valid_moves, depth, alpha, beta, turn_multiplier)
+        delta *= 4
+        if score <= alpha and alpha > -CHECKMATE:
+            alpha = guess - delta
+        elif score >= beta and beta < CHECKMATE:
+            beta = guess + delta
+        else:
+            return score
+        stats.aspiration_researches += 1
+
+
+"""
+The reply the search expects to move, taken from the transposition table entry of the position after it, or None.
+This is the move the AI ponders on
+"""
+
+
+def find_expected_reply(gs, move):
+    gs.make_move(move)
+    entry = transposition_table.probe(gs.zobrist_key)
+    reply = None
+    if entry is not None and entry[BEST_MOVE] is not None:
+        reply = gs.legal_move(entry[BEST_MOVE])
+    gs.undo_move()
+    return reply
+
+
+"""
+The best move followed by the best moves the transposition table has for the positions after it, up to depth moves
+"""
+
+
+def find_principal_variation(gs, best_move, depth):
+    if best_move is None:
+        return []
+    pv = [best_move]
+    gs.make_move(best_move)
+    while len(pv) < depth:
+        entry = transposition_table.probe(gs.zobrist_key)
+        move = gs.legal_move(entry[BEST_MOVE]) if entry is not None and entry[BEST_MOVE] is not None else None
+        if move is None:
+            break
+        pv.append(move)
+        gs.make_move(move)
+    for _ in pv:
+        gs.undo_move()
+    return pv
+
+
+"""
+Searches only the given root moves to a fixed depth, used by the parallel search to split the root between processes.
+Returns (best move, score, nodes searched), with best move and score None if the search was stopped before finishing.
+When every move loses to a mate none of them beats the starting score, the first one is returned then so the caller
+still gets a move with the score.
+The root position isn't stored in the transposition table, a result for some of the moves says nothing about the
+position and would push out the entry of whoever else is searching the rest of them
+"""
+
+
+def search_root_moves(gs, root_moves, depth, time_budget=None, new_position=True):
+    global next_move, root_depth, deadline, split_root, split_root_best, stats
+    stats = SearchStats(gs.zobrist_key)
+    if new_position:
+        transposition_table.new_search()
+        move_orderer.new_search()
+        split_root_best = None
+    next_move = None
+    split_root = True
+    root_depth = depth
+    deadline = time.perf_counter() + time_budget if time_budget is not None else None
+    move_log_length = len(gs.move_log)
+    try:
+        score = find_move_nega_max_alpha_beta(gs, root_moves, depth, -CHECKMATE, CHECKMATE,
+                                              1 if gs.white_to_move else -1)
+    except SearchTimeout:
+        while len(gs.move_log) > move_log_length:
+            gs.undo_move()
+        return None, None, stats.total_nodes()
+    finally:
+        deadline = None
+        split_root = False
+    if next_move is None:  # all of them get mated
+        next_move = root_moves[0]
+    split_root_best = next_move.move_ID
+    return next_move, score, stats.total_nodes()
+
+
+"""
+Checked every CHECK_TIME_EVERY nodes
+"""
+
+
+def search_interrupted():
+    if should_stop is not None and should_stop():
+        return True
+    return deadline is not None and root_depth > 1 and time.perf_counter() > deadline
+
+
+def side_to_move_in_check(gs):
+    return gs.square_under_attack(*(gs.white_king_location if gs.white_to_move else gs.black_king_location))
+
+
+"""
+Passing can be the best move when only the king and pawns are left (zugzwang), null move pruning would get those wrong
+"""
+
+
+def has_pieces(gs):
+    color = "w" if gs.white_to_move else "b"
+    bitboards = gs.bitboards
+    return bitboards[color + "N"] | bitboards[color + "B"] | bitboards[color + "R"] | bitboards[color + "Q"] != 0
 
 
 """
@@ -90,55 +379,199 @@ def find_move_nega_max(gs, valid_moves, depth, turn_multiplier):
     return max_score
 
 
-def find_move_nega_max_alpha_beta(gs, valid_moves, depth, alpha, beta, turn_multiplier):
-    global next_move, counter
-    counter += 1
+"""
+valid_moves is the list of root moves to search. Below the root it is None and the moves are generated lazily by
+move_orderer.staged_moves, so a node that cuts off early doesn't generate the moves it never gets to.
+Below the root two things make the tree smaller, each switched by its flag:
+null move pruning - let the opponent move twice, and if a reduced search still fails high a real move will too
+late move reductions - quiet moves ordered after the first few are unlikely to be best, so they get a shallower null
+    window search first and only a full one if that beats alpha
+Every node also does a principal variation search (PRINCIPAL_VARIATION_SEARCH): the first move, the best one if the
+ordering is right, gets the full window and the rest only a null window, which just asks whether they beat alpha.
+Only a move that does and lands inside the window is searched again with all of it
+"""
+
+
+def find_move_nega_max_alpha_beta(gs, valid_moves, depth, alpha, beta, turn_multiplier, ply=0):
+    global next_move, root_in_bitbase
+    stats.nodes += 1
+    if stats.nodes % CHECK_TIME_EVERY == 0 and search_interrupted():
+        raise SearchTimeout()
+    original_alpha = alpha
+
+    # reuse the result if this position has already been searched at least this deep
+    # (not at the root, the root has to pick next_move)
+    entry = transposition_table.probe(gs.zobrist_key)
+    if entry is not None and entry[TT_DEPTH] >= depth and ply != 0:
+        if entry[BOUND] == EXACT:
+            return entry[SCORE]
+        elif entry[BOUND] == LOWER_BOUND:
+            alpha = max(alpha, entry[SCORE])
+        else:
+            beta = min(beta, entry[SCORE])
+        if alpha >= beta:
+            return entry[SCORE]
+
+    # a position that has just gone down into a bitbase ending needs no search. If the root is already in one the tree
+    # is searched as usual, the bitbase only scores the leaves, so the search can find its way to the mate
+    if ply == 0:
+        root_in_bitbase = pop_count(gs.occupied) <= BITBASE_PIECES
+    elif BITBASES and not root_in_bitbase and pop_count(gs.occupied) <= BITBASE_PIECES and \
+            not side_to_move_in_check(gs):
+        # positions in check are left to the search, which tells a mate from a bitbase win
+        score = bitbase.probe(gs)
+        if score is not None:
+            return turn_multiplier * score
+
     if depth == 0:
+        if QUIESCENCE:
+            return quiescence_search(gs, alpha, beta, turn_multiplier, ply, True)
+        gs.get_valid_moves()  # sets the checkmate and stalemate flags score_board looks at
         return turn_multiplier * score_board(gs)
 
-    # TODO move ordering - implement method here that orders moves best to worst
+    in_check = side_to_move_in_check(gs)
+    # not in check (passing would leave the king in check), not twice in a row, not near a mate score and not in
+    # zugzwang-prone king and pawn endings. Only tried when the position already looks good enough to fail high
+    if NULL_MOVE_PRUNING and ply != 0 and depth >= NULL_MOVE_MIN_DEPTH and not in_check and beta < CHECKMATE and \
+            gs.move_log[-1] is not None and has_pieces(gs) and turn_multiplier * score_board(gs) >= beta:
+        gs.make_null_move()
+        score = -find_move_nega_max_alpha_beta(gs, None, depth - 1 - NULL_MOVE_REDUCTION, -beta,
+                                               -beta + MIN_SCORE_STEP, -turn_multiplier, ply + 1)
+        gs.undo_move()
+        if score >= beta:
+            stats.null_move_cutoffs += 1
+            return beta if score >= CHECKMATE else score  # a mate found after passing isn't a real one
+
+    # try the best move found by an earlier search of this position first, then captures, killers and history
+    if ply == 0 and split_root:
+        hash_move_id = split_root_best
+    else:
+        hash_move_id = entry[BEST_MOVE] if entry is not None else None
+    if valid_moves is not None:
+        moves = move_orderer.order_moves(valid_moves, hash_move_id, ply)
+    else:
+        moves = move_orderer.staged_moves(gs, hash_move_id, ply)
 
     max_score = -CHECKMATE
-    for move in valid_moves:
+    best_move = None
+    moves_searched = 0
+    killers = move_orderer.killers[ply] if ply < len(move_orderer.killers) else ()
+    for move in moves:
+        moves_searched += 1
         gs.make_move(move)
-        next_moves = gs.get_valid_moves()
-        score = -find_move_nega_max_alpha_beta(gs, next_moves, depth - 1, -beta, -alpha, -turn_multiplier)
+        reduction = 0
+        if LATE_MOVE_REDUCTIONS and ply != 0 and depth >= LMR_MIN_DEPTH and moves_searched > LMR_FULL_MOVES and \
+                not in_check and not move.is_capture and not move.is_pawn_promotion and \
+                move.move_ID not in killers and not side_to_move_in_check(gs):
+            reduction = min(1 if moves_searched <= 2 * LMR_FULL_MOVES else 2, depth - 2)
+        full_window = True
+        if reduction or (PRINCIPAL_VARIATION_SEARCH and moves_searched > 1):
+            score = -find_move_nega_max_alpha_beta(gs, None, depth - 1 - reduction, -alpha - MIN_SCORE_STEP, -alpha,
+                                                   -turn_multiplier, ply + 1)
+            if score > alpha and reduction:
+                stats.lmr_researches += 1
+                score = -find_move_nega_max_alpha_beta(gs, None, depth - 1, -alpha - MIN_SCORE_STEP, -alpha,
+                                                       -turn_multiplier, ply + 1)
+            # a fail low is already the answer, and so is a fail high when the window is a null window anyway
+            full_window = alpha < score < beta
+            if full_window:
+                stats.pvs_researches += 1
+        if full_window:
+            score = -find_move_nega_max_alpha_beta(gs, None, depth - 1, -beta, -alpha, -turn_multiplier, ply + 1)
         if score > max_score:
             max_score = score
-            if depth == DEPTH:
+            best_move = move
+            if ply == 0:
                 next_move = move
         gs.undo_move()
         # pruning
         if max_score > alpha:
             alpha = max_score
         if alpha >= beta:
+            stats.beta_cutoffs += 1
+            if moves_searched == 1:
+                stats.first_move_cutoffs += 1
+            move_orderer.record_cutoff(move, depth, ply)
             break
+
+    if moves_searched == 0:  # nothing was made since the last stage was generated, so in_check is still this node's
+        return -CHECKMATE if gs.in_check else STALEMATE
+
+    if max_score <= original_alpha:
+        bound = UPPER_BOUND
+    elif max_score >= beta:
+        bound = LOWER_BOUND
+    else:
+        bound = EXACT
+    if ply != 0 or not split_root:
+        transposition_table.store(gs.zobrist_key, depth, max_score, bound, best_move)
+    return max_score
+
+
+"""
+Searches only captures until the position is quiet, so the score isn't taken halfway through an exchange.
+The side to move can always "stand pat" and keep the static score instead of capturing.
+leaf is True for the call at the end of the main search, which also has to spot a stalemate
+"""
+
+
+def quiescence_search(gs, alpha, beta, turn_multiplier, ply, leaf=False):
+    stats.quiescence_nodes += 1
+    if stats.quiescence_nodes % CHECK_TIME_EVERY == 0 and search_interrupted():
+        raise SearchTimeout()
+
+    moves = gs.get_valid_moves(captures_only=True)
+    if gs.in_check:  # standing pat isn't an option in check, every evasion has to be looked at
+        moves = gs.get_valid_moves()
+
+    if gs.in_check:
+        if len(moves) == 0:
+            return -CHECKMATE
+        max_score = -CHECKMATE
+    else:
+        if leaf and len(moves) == 0 and len(gs.get_valid_moves(quiets_only=True)) == 0:
+            return STALEMATE
+        max_score = turn_multiplier * score_board(gs)  # stand pat
+        if max_score >= beta:
+            return max_score
+        if max_score > alpha:
+            alpha = max_score
+
+    move_orderer.order_moves(moves, None, ply)  # MVV-LVA
+    for move in moves:
+        gs.make_move(move)
+        score = -quiescence_search(gs, -beta, -alpha, -turn_multiplier, ply + 1)
+        gs.undo_move()
+        if score > max_score:
+            max_score = score
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
     return max_score
 
 
 """
 Score the position. Positive score is good for white, negative is good for black
+Material and piece-square totals are kept up to date by make_move/undo_move, so this doesn't have to scan the board
 """
 
 
 def score_board(gs):
     if gs.checkmate:
         if gs.white_to_move:
-            return CHECKMATE  # black wins
+            return -CHECKMATE  # black wins
         else:
             return CHECKMATE  # white wins
     elif gs.stalemate:
         return STALEMATE
 
-    score = 0
-    for row in gs.board:
-        for square in row:
-            if square[0] == "w":
-                score += piece_values[square[1]]
-            elif square[0] == "b":
-                score -= piece_values[square[1]]
+    if BITBASES and pop_count(gs.occupied) <= BITBASE_PIECES:
+        score = bitbase.probe(gs)
+        if score is not None:
+            return score
 
-    return score
+    return gs.material + gs.positional * POSITIONAL_WEIGHT
 
 
 """
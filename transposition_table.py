@@ -0,0 +1,85 @@
+"""
+Transposition table for the alpha beta search. Positions are looked up by GameState.zobrist_key so a position reached
+through a different move order doesn't have to be searched again.
+"""
+
+# bound types: what the stored score says about the real score of the position
+EXACT = 0
+LOWER_BOUND = 1  # search failed high, real score >= score
+UPPER_BOUND = 2  # search failed low, real score <= score
+
+# rough size of a filled slot: the list pointer, the entry tuple and the ints inside it
+ENTRY_SIZE = 160
+
+# entry layout
+KEY, DEPTH, SCORE, BOUND, BEST_MOVE, AGE = range(6)
+
+
+class TranspositionTable:
+    """
+    Every key maps to a bucket of two slots. The first slot keeps the deepest search of the bucket (depth-preferred),
+    the second takes whatever was stored last (always-replace), so shallow results can't push out expensive ones
+    but the table still keeps up with the current search
+    """
+    def __init__(self, size_mb=16):
+        self.bucket_count = max(1, size_mb * 1024 * 1024 // (2 * ENTRY_SIZE))
+        self.entries = [None] * (2 * self.bucket_count)
+        self.age = 0  # bumped every search so deep entries from old searches can be replaced
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0  # stores that pushed out an entry for a different position
+
+    """
+    Returns the entry tuple for the key or None
+    """
+    def probe(self, key):
+        self.probes += 1
+        index = (key % self.bucket_count) * 2
+        entry = self.entries[index]
+        if entry is not None and entry[KEY] == key:
+            self.hits += 1
+            return entry
+        entry = self.entries[index + 1]
+        if entry is not None and entry[KEY] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    """
+    best_move is kept as its move_ID so entries are small and the same for every table implementation
+    """
+    def store(self, key, depth, score, bound, best_move):
+        self.stores += 1
+        index = (key % self.bucket_count) * 2
+        entry = (key, depth, score, bound, best_move.move_ID if best_move is not None else None, self.age)
+        deepest = self.entries[index]
+        if deepest is None or deepest[KEY] == key or depth >= deepest[DEPTH] or deepest[AGE] != self.age:
+            self.entries[index] = entry
+            if deepest is not None and deepest[KEY] != key:
+                # the old deep entry is still worth more than whatever was in the always-replace slot
+                replaced = self.entries[index + 1]
+                if replaced is not None and replaced[KEY] != key:
+                    self.overwrites += 1
+                self.entries[index + 1] = deepest
+            elif self.entries[index + 1] is not None and self.entries[index + 1][KEY] == key:
+                self.entries[index + 1] = None  # don't keep a stale copy of the same position
+        else:
+            replaced = self.entries[index + 1]
+            if replaced is not None and replaced[KEY] != key:
+                self.overwrites += 1
+            self.entries[index + 1] = entry
+
+    """
+    Call at the start of every search. Keeps the entries but lets the new search replace them freely
+    """
+    def new_search(self):
+        self.age += 1
+        self.probes = self.hits = self.stores = self.overwrites = 0
+
+    def clear(self):
+        self.entries = [None] * (2 * self.bucket_count)
+        self.probes = self.hits = self.stores = self.overwrites = 0
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
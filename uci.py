@@ -0,0 +1,233 @@
+"""
+Universal Chess Interface front end, so the engine can be run without the pygame window: by a tournament manager, a
+chess GUI or a script. Commands are read from stdin and answers written to stdout, everything the search prints along
+the way goes to stderr.
+A thread reads stdin into a queue while the search runs in the main thread and polls the queue through
+smart_move_finder.should_stop, so "stop" and "isready" are answered within CHECK_TIME_EVERY nodes.
+
+Supported: uci, isready, ucinewgame, setoption (Hash, OwnBook, NullMove, LMR, PVS, Aspiration, StatsFile),
+position startpos|fen ... [moves ...], go [wtime btime winc binc movetime depth nodes infinite], stop, quit
+The engine always promotes to a queen, so a promotion in a position command is played as one whatever piece it names.
+
+usage: python uci.py
+"""
+
+from collections import deque
+import queue
+import sys
+import threading
+import engine
+import profiling
+import smart_move_finder
+from move_ordering import MoveOrderer
+from transposition_table import TranspositionTable
+
+ENGINE_NAME = "PygameChess"
+MAX_HASH_MB = 1024
+
+uci_output = sys.stdout  # set aside before stdout is pointed at stderr
+
+
+def send(*words):
+    print(*words, file=uci_output, flush=True)
+
+
+"""
+Runs in a daemon thread, puts every line from stdin on the queue and a "quit" once stdin is closed
+"""
+
+
+def read_input(lines):
+    for line in sys.stdin:
+        lines.put(line.strip())
+    lines.put("quit")
+
+
+class UciEngine:
+    def __init__(self):
+        self.gs = engine.GameState()
+        self.lines = queue.Queue()
+        self.pending = deque()  # commands that arrived during a search, handled once it is over
+        self.stopped = False  # "stop" or "quit" arrived during the current search
+        self.quitting = False
+        self.node_limit = None
+
+    """
+    Handles commands until "quit"
+    """
+    def run(self):
+        threading.Thread(target=read_input, args=(self.lines,), daemon=True).start()
+        while not self.quitting:
+            line = self.pending.popleft() if self.pending else self.lines.get()
+            self.handle(line)
+
+    def handle(self, line):
+        words = line.split()
+        if not words:
+            return
+        command = words[0]
+        if command == "uci":
+            send("id name", ENGINE_NAME)
+            send("id author", ENGINE_NAME, "authors")
+            send("option name Hash type spin default", smart_move_finder.TT_SIZE_MB, "min 1 max", MAX_HASH_MB)
+            send("option name OwnBook type check default", "true" if smart_move_finder.USE_BOOK else "false")
+            send("option name NullMove type check default", "true" if smart_move_finder.NULL_MOVE_PRUNING else "false")
+            send("option name LMR type check default", "true" if smart_move_finder.LATE_MOVE_REDUCTIONS else "false")
+            send("option name PVS type check default",
+                 "true" if smart_move_finder.PRINCIPAL_VARIATION_SEARCH else "false")
+            send("option name Aspiration type check default", "true" if smart_move_finder.ASPIRATION_WINDOWS else "false")
+            send("option name StatsFile type string default", smart_move_finder.STATS_FILE or "<empty>")
+            send("uciok")
+        elif command == "isready":
+            send("readyok")
+        elif command == "ucinewgame":
+            smart_move_finder.transposition_table.clear()
+            smart_move_finder.move_orderer = MoveOrderer()
+            self.gs = engine.GameState()
+        elif command == "setoption":
+            self.set_option(words)
+        elif command == "position":
+            self.set_position(words)
+        elif command == "go":
+            self.go(words)
+        elif command == "quit":
+            self.quitting = True
+        elif command != "stop":  # a stop with no search running has nothing to do
+            print("Unknown command:", line)
+
+    """
+    setoption name <name> value <value>
+    """
+    def set_option(self, words):
+        if "name" not in words or "value" not in words:
+            return
+        name = " ".join(words[words.index("name") + 1:words.index("value")]).lower()
+        value = " ".join(words[words.index("value") + 1:])
+        if name == "hash":
+            smart_move_finder.TT_SIZE_MB = max(1, min(MAX_HASH_MB, int(value)))
+            smart_move_finder.transposition_table = TranspositionTable(smart_move_finder.TT_SIZE_MB)
+        elif name == "ownbook":
+            smart_move_finder.USE_BOOK = value.lower() == "true"
+        elif name == "nullmove":
+            smart_move_finder.NULL_MOVE_PRUNING = value.lower() == "true"
+        elif name == "lmr":
+            smart_move_finder.LATE_MOVE_REDUCTIONS = value.lower() == "true"
+        elif name == "pvs":
+            smart_move_finder.PRINCIPAL_VARIATION_SEARCH = value.lower() == "true"
+        elif name == "aspiration":
+            smart_move_finder.ASPIRATION_WINDOWS = value.lower() == "true"
+        elif name == "statsfile":  # a JSON line of search statistics per move, see search_stats.py
+            smart_move_finder.STATS_FILE = value if value not in ("", "<empty>") else None
+        else:
+            print("Unknown option:", name)
+
+    """
+    position startpos [moves e2e4 e7e5 ...] or position fen <fen> [moves ...]
+    """
+    def set_position(self, words):
+        moves = []
+        if "moves" in words:
+            moves = words[words.index("moves") + 1:]
+            words = words[:words.index("moves")]
+        self.gs = engine.GameState()
+        if len(words) > 2 and words[1] == "fen":
+            self.gs.load_fen(" ".join(words[2:]))
+        for text in moves:
+            move = find_uci_move(self.gs.get_valid_moves(), text)
+            if move is None:
+                print("Illegal move in position command:", text)
+                break
+            self.gs.make_move(move)
+
+    """
+    Searches the current position and answers with bestmove. Times come in milliseconds.
+    With a clock the search gets its share of it like the GUI's AI, movetime fixes the time instead, depth alone
+    searches to that depth, and infinite (or no limit at all) deepens until "stop"
+    """
+    def go(self, words):
+        options = {}
+        infinite = "infinite" in words
+        for i, word in enumerate(words[:-1]):
+            if word in ("wtime", "btime", "winc", "binc", "movetime", "depth", "nodes"):
+                options[word] = int(words[i + 1])
+        white = self.gs.white_to_move
+        clock = options.get("wtime" if white else "btime")
+        increment = options.get("winc" if white else "binc", 0) / 1000
+        move_time = options["movetime"] / 1000 if "movetime" in options else None
+        depth = options.get("depth")
+        self.node_limit = options.get("nodes")
+        if clock is None and move_time is None and depth is None:
+            infinite = True  # only a node limit, or nothing at all, stops this search
+
+        valid_moves = self.gs.get_valid_moves()
+        self.stopped = False
+        smart_move_finder.should_stop = self.poll_input
+        smart_move_finder.report_iteration = self.send_info
+        try:
+            best_move = smart_move_finder.find_best_move(
+                self.gs, valid_moves, time_remaining=clock / 1000 if clock is not None else None,
+                increment=increment, ponder=infinite, move_time=move_time, max_depth=depth)
+        finally:
+            smart_move_finder.should_stop = None
+            smart_move_finder.report_iteration = None
+        # an infinite search that ran out of depth (or found a mate) still waits for "stop", as UCI asks
+        while infinite and self.node_limit is None and not self.stopped:
+            self.handle_during_search(self.lines.get())
+        if best_move is None and len(valid_moves) != 0:  # stopped before depth 1 finished, or every move loses
+            best_move = valid_moves[0]
+        send("bestmove", best_move.get_long_algebraic() if best_move is not None else "0000")
+
+    """
+    should_stop for the search: reads whatever has arrived on stdin without waiting for more
+    """
+    def poll_input(self):
+        while not self.stopped:
+            try:
+                self.handle_during_search(self.lines.get_nowait())
+            except queue.Empty:
+                break
+        if self.node_limit is not None and \
+                smart_move_finder.stats.total_nodes() >= self.node_limit:
+            self.stopped = True
+        return self.stopped
+
+    def handle_during_search(self, line):
+        command = line.split()[0] if line.split() else ""
+        if command == "stop":
+            self.stopped = True
+        elif command == "quit":
+            self.stopped = self.quitting = True
+        elif command == "isready":
+            send("readyok")
+        elif command:
+            self.pending.append(line)
+
+    """
+    report_iteration for the search: one info line per completed depth
+    """
+    def send_info(self, stats):
+        iteration = stats.iterations[-1]
+        nodes = iteration["total_nodes"]
+        elapsed = iteration["total_seconds"]
+        # mates aren't scored by distance (the quiescence search finds some past the depth), so they go out as
+        # centipawns too, CHECKMATE pawns
+        send("info depth", iteration["depth"], "score cp", round(iteration["score"] * 100), "nodes", nodes,
+             "nps", int(nodes / max(elapsed, 0.001)), "time", int(elapsed * 1000), "pv", " ".join(iteration["pv"]))
+
+
+"""
+The Move in valid_moves written as text in long algebraic notation, or None
+"""
+
+
+def find_uci_move(valid_moves, text):
+    for move in valid_moves:
+        if move.get_long_algebraic()[:4] == text[:4]:
+            return move
+    return None
+
+
+if __name__ == "__main__":
+    sys.stdout = sys.stderr  # the search's own progress prints must not get mixed into the protocol
+    profiling.install()  # only if CHESS_PROFILE is set
+    UciEngine().run()
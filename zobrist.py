@@ -0,0 +1,45 @@
+"""
+Random keys for Zobrist hashing. A position's key is the xor of the keys for every piece on its square, the side to
+move, the castling rights and the en passant file, so a move only has to xor in and out the few keys it changes.
+The keys come from a fixed seed so hashes are the same in every process and between runs.
+"""
+
+import random
+
+_generator = random.Random(0x5EED)
+
+
+def _random_key():
+    return _generator.getrandbits(64)
+
+
+PIECE_KEYS = {color + piece: [_random_key() for _ in range(64)] for color in "wb" for piece in "PNBRQK"}
+SIDE_KEY = _random_key()  # xor-ed in when black is to move
+CASTLING_KEYS = [_random_key() for _ in range(16)]  # indexed by the castling rights bitmask (see engine.py)
+EN_PASSANT_KEYS = [_random_key() for _ in range(8)]  # indexed by file
+
+
+def castling_key(castling_rights):
+    return CASTLING_KEYS[castling_rights]
+
+
+def en_passant_key(en_passant_possible):
+    return EN_PASSANT_KEYS[en_passant_possible[1]] if en_passant_possible != () else 0
+
+
+"""
+Hashes a position from scratch. Only used when a GameState is set up, after that make_move and undo_move keep the key
+up to date
+"""
+
+
+def compute_key(gs):
+    key = 0
+    for row in range(8):
+        for col in range(8):
+            piece = gs.board[row][col]
+            if piece != "--":
+                key ^= PIECE_KEYS[piece][row * 8 + col]
+    if not gs.white_to_move:
+        key ^= SIDE_KEY
+    return key ^ castling_key(gs.castling_rights) ^ en_passant_key(gs.en_passant_possible)